@@ -0,0 +1,113 @@
+"""
+Micro-benchmark of the C8855 photon counter readout, driven by a stub DLL.
+
+Compares the original per-cycle conversion, a fresh ctypes buffer boxed through a Python
+list, against the driver's zero-copy view and in-place uint64 histogram. The stub returns
+immediately, so the timings are the host side overhead per measurement.
+
+Usage:
+    python benchmarks/c8855_readout.py [cycles]
+"""
+
+import ctypes
+import os
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+import toml
+
+NUMBER_OF_GATES = 512
+
+
+class StubDLL:
+    """Stands in for the C8855 DLL, filling every transfer buffer with the same counts."""
+
+    def __init__(self, path=None):
+        self.counts = np.random.default_rng(0).integers(0, 1000, 1024, dtype=np.uint32)
+        for name in (
+            "C8855Open",
+            "C8855Reset",
+            "C8855Setup",
+            "C8855CountStart",
+            "C8855CountStop",
+            "C8855Close",
+        ):
+            setattr(self, name, _Function(lambda *args: 1))
+        self.C8855ReadData = _Function(self.read_data)
+
+    def read_data(self, handle, data_buffer, result):
+        np.ctypeslib.as_array(data_buffer)[:] = self.counts
+        return True
+
+
+class _Function:
+    def __init__(self, implementation):
+        self.implementation = implementation
+
+    def __call__(self, *args):
+        return self.implementation(*args)
+
+
+# the driver loads the DLL through ctypes.WinDLL, which only exists on Windows
+ctypes.WinDLL = StubDLL
+
+from spcs_instruments import C8855_counting_unit  # noqa: E402
+
+
+def legacy_measure(dll: StubDLL, cycles: int):
+    """The readout measure() used before buffers were reused and viewed with numpy."""
+    bin_cycles = 0
+    total_counts = 0
+    for _ in range(cycles):
+        data_buffer = (ctypes.c_ulong * 1024)()
+        dll.C8855ReadData(None, data_buffer, None)
+        bin_counts = np.asarray(list(data_buffer))
+        bin_counts = bin_counts[: 512 - (512 - NUMBER_OF_GATES)]
+        counts = np.sum(bin_counts)
+        bin_cycles += bin_counts
+        total_counts += counts
+    return bin_cycles, total_counts
+
+
+def main(cycles: int = 1000) -> None:
+    config = {
+        "device": {
+            "C8855_photon_counter": {
+                "transfer_type": "block_transfer",
+                "number_of_gates": NUMBER_OF_GATES,
+                "gate_time": "50us",
+                "trigger_type": "software",
+                "cycles": cycles,
+                "measure_mode": "all",
+                "session": True,
+                "dll_path": "stub",
+            }
+        }
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        config_path = os.path.join(directory, "config.toml")
+        with open(config_path, "w") as f:
+            toml.dump(config, f)
+        with C8855_counting_unit(config_path, connect_to_rex=False) as counter:
+            legacy_trace, legacy_counts = legacy_measure(counter.dll, cycles)
+            trace, counts = counter.measure()
+            assert np.array_equal(legacy_trace, trace) and legacy_counts == counts
+
+            legacy = min(
+                timeit.repeat(
+                    lambda: legacy_measure(counter.dll, cycles), number=1, repeat=5
+                )
+            )
+            current = min(timeit.repeat(counter.measure, number=1, repeat=5))
+
+    print(f"cycles:                {cycles} of {NUMBER_OF_GATES} gates")
+    print(f"legacy list readout:   {legacy * 1e3:10.2f} ms ({legacy / cycles * 1e6:.1f} us/cycle)")
+    print(
+        f"zero-copy readout:     {current * 1e3:10.2f} ms ({current / cycles * 1e6:.1f} us/cycle, {legacy / current:.0f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
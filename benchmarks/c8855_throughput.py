@@ -0,0 +1,72 @@
+"""
+Acquisition throughput of the C8855 driver against the in-process emulator backend.
+
+Runs the same measurement with the per-cycle open/reset/setup sequence, with a persistent
+session, and with the streaming thread, and reports the achieved block rate next to the
+limit set by number_of_gates x gate time.
+
+Usage:
+    python benchmarks/c8855_throughput.py [cycles]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import toml
+
+from spcs_instruments import C8855_counting_unit
+
+GATE_TIME = "50us"
+NUMBER_OF_GATES = 64
+# assumed USB transfer and configuration call times of the real unit
+READ_LATENCY = 0.2e-3
+SETUP_LATENCY = 2e-3
+
+
+def run(config_path: str, stream: bool) -> float:
+    with C8855_counting_unit(config_path, connect_to_rex=False) as counter:
+        if stream:
+            counter.start_stream()
+        started = time.perf_counter()
+        counter.measure()
+        return counter.cycles / (time.perf_counter() - started)
+
+
+def main(cycles: int = 200) -> None:
+    config = {
+        "transfer_type": "block_transfer",
+        "number_of_gates": NUMBER_OF_GATES,
+        "gate_time": GATE_TIME,
+        "trigger_type": "software",
+        "cycles": cycles,
+        "measure_mode": "all",
+        "backend": "emulator",
+        "emulator_rate": 1e6,
+        "emulator_latency": READ_LATENCY,
+        "emulator_setup_latency": SETUP_LATENCY,
+    }
+    block_seconds = 50e-6 * NUMBER_OF_GATES
+    print(f"{cycles} blocks of {NUMBER_OF_GATES} x {GATE_TIME} gates")
+    print(f"gate limited rate:       {1 / block_seconds:10.1f} blocks/s")
+    with tempfile.TemporaryDirectory() as directory:
+        for label, session, stream in (
+            ("per cycle setup", False, False),
+            ("persistent session", True, False),
+            ("streaming", True, True),
+        ):
+            config_path = os.path.join(directory, f"{label}.toml")
+            with open(config_path, "w") as f:
+                toml.dump(
+                    {"device": {"C8855_photon_counter": {**config, "session": session}}},
+                    f,
+                )
+            rate = run(config_path, stream)
+            print(
+                f"{label + ':':<24} {rate:10.1f} blocks/s ({rate * block_seconds:.0%} of gate limited)"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
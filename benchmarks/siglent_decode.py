@@ -0,0 +1,88 @@
+"""
+Micro-benchmark of the Siglent SDS2352X-E waveform decoding.
+
+Compares the original per-byte Python decoding of a `wf? dat2` response against the
+numpy decoder used by SiglentSDS2352XE.get_waveform, on a synthetic record.
+
+Usage:
+    python benchmarks/siglent_decode.py [samples]
+"""
+
+import sys
+import timeit
+
+import numpy as np
+
+from spcs_instruments.instruments.oscilloscopes.scope_support import (
+    decode_siglent_waveform,
+    siglent_time_parameters,
+    time_axis,
+)
+
+VDIV, OFST, TDIV, SARA, HORIZONTAL_OFFSET = "2.00E-01", "-1.00E-01", "5.00E-06", 1e9, 1e-6
+
+
+def synthetic_response(samples: int) -> bytes:
+    codes = np.random.default_rng(0).integers(0, 256, samples, dtype=np.uint8)
+    return b"DAT2,#9" + str(samples).zfill(9).encode() + codes.tobytes() + b"\n\n"
+
+
+def legacy_decode(raw: bytes):
+    """The decoding loop get_waveform used before it was vectorised."""
+    recv = list(raw)[16:]
+    recv.pop()
+    recv.pop()
+    volt_value = []
+    for data in recv:
+        if data > 127:
+            data = data - 256
+        volt_value.append(data)
+    time_value = []
+    for idx in range(0, len(volt_value)):
+        volt_value[idx] = volt_value[idx] / 25 * float(VDIV) - float(OFST)
+        time_data = -(float(TDIV) * 14 / 2) + idx * (1 / SARA) - HORIZONTAL_OFFSET
+        time_value.append(time_data)
+    return np.asarray(time_value), np.asarray(volt_value)
+
+
+def vectorised_decode(raw: bytes, out: np.ndarray, materialise_time: bool = True):
+    voltages = decode_siglent_waveform(raw, float(VDIV), float(OFST), out=out)
+    parameters = siglent_time_parameters(
+        voltages.size, float(TDIV), SARA, HORIZONTAL_OFFSET
+    )
+    return (time_axis(parameters) if materialise_time else parameters), voltages
+
+
+def main(samples: int = 1_000_000) -> None:
+    raw = synthetic_response(samples)
+    out = np.empty(samples)
+
+    legacy_t, legacy_v = legacy_decode(raw)
+    new_t, new_v = vectorised_decode(raw, out)
+    assert np.array_equal(legacy_v, new_v)
+    assert np.allclose(legacy_t, new_t, rtol=0, atol=1e-15)
+
+    legacy = min(timeit.repeat(lambda: legacy_decode(raw), number=1, repeat=3))
+    vectorised = min(
+        timeit.repeat(lambda: vectorised_decode(raw, out), number=1, repeat=10)
+    )
+    parameters_only = min(
+        timeit.repeat(
+            lambda: vectorised_decode(raw, out, materialise_time=False),
+            number=1,
+            repeat=10,
+        )
+    )
+
+    print(f"samples:                    {samples}")
+    print(f"legacy python loop:         {legacy * 1e3:10.2f} ms")
+    print(
+        f"numpy, full time axis:      {vectorised * 1e3:10.2f} ms ({legacy / vectorised:.0f}x)"
+    )
+    print(
+        f"numpy, time parameters:     {parameters_only * 1e3:10.2f} ms ({legacy / parameters_only:.0f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -8,11 +8,11 @@ from spcs_instruments import C8855_counting_unit
 
 def test_fake_experiment():
     def a_measurement(config) -> dict:
-        counter = C8855_counting_unit(config)
-        counter.setup_config()
-        for i in range(100):
-            data = counter.measure()
-            time.sleep(0.1)
+        # the device is opened once and closed when the block exits
+        with C8855_counting_unit(config) as counter:
+            for i in range(100):
+                data = counter.measure()
+                time.sleep(0.1)
 
     dir_path = os.path.dirname(os.path.abspath(__file__))
     config_path = os.path.join(dir_path, "..", "templates", "config6.toml")
@@ -1,14 +1,19 @@
 import ctypes
+import queue
+import threading
 import time
 from typing import TypeVar
 
 import numpy as np
-from rex_utils import DeviceError, Measurement, RexSupport
+from rex_utils import DeviceError, Measurement
+
+from ..rex_support import ArrayMeasurement, SpcsRexSupport
+from .c8855_support import GATE_TIME_SECONDS, BinStatistics, load_backend
 
 Pointer_c_ulong = TypeVar("Pointer_c_ulong")
 
 
-class C8855_counting_unit(RexSupport):
+class C8855_counting_unit(SpcsRexSupport):
     """Class for controlling the C8855 photon counting unit.
 
     Attributes:
@@ -20,6 +25,19 @@ class C8855_counting_unit(RexSupport):
         connect_to_rex (bool): Indicates whether to connect to the rex experiment manager.
         sock (socket, optional): Socket connection for rex, if enabled.
         data (dict): Stores measurement data.
+        backend (str): Library backend in use, one of windll, cdll or emulator.
+        dll (ctypes.WinDLL | ctypes.CDLL | C8855Emulator): The library the C8855 API is called through.
+        session (bool): Whether the device is kept open and configured between cycles.
+        device_handle (ctypes.c_void_p, optional): Handle of the open device, None while no session is open.
+        streaming (bool): Whether the streaming acquisition thread is running.
+        data_buffer (ctypes.Array): Transfer buffer the device reads into every cycle.
+        buffer_view (np.ndarray): Zero-copy numpy view of data_buffer.
+        bin_cycles (np.ndarray): uint64 histogram of counts per gate, accumulated over the cycles of a measurement.
+        statistics (BinStatistics): Running per-gate mean, variance and standard error over the cycles of a measurement.
+        target_relative_error (float): Relative error of the total counts at which a measurement stops early, 0 to disable.
+        cycles_measured (int): Number of cycles the last measurement took.
+        stream_stalls (int): Number of times the streaming thread had to wait for the consumer to release a buffer.
+        stream_discarded (int): Number of streamed blocks dropped because they started counting before the measurement asking for them.
         __toml_config__ (dict): Default configuration template for the device
     """
 
@@ -93,14 +111,54 @@ class C8855_counting_unit(RexSupport):
                 "_description": "Type of device triggering to use (external, software)",
             },
             "cycles": {"_value": 16, "_description": "Number of cycles to take"},
+            "target_relative_error": {
+                "_value": 0.0,
+                "_description": "Stop taking cycles once the relative standard error of the total counts reaches this value, 0 always takes all cycles",
+            },
+            "min_cycles": {
+                "_value": 2,
+                "_description": "Minimum number of cycles taken before stopping early, at least 2",
+            },
             "measure_mode": {
                 "_value": "counts_only",
                 "_description": "Measurement mode to use, counts only (counts_only), trace only (trace), or both as a tupple (all)",
             },
+            "session": {
+                "_value": False,
+                "_description": "Open and configure the device once and keep it open between cycles, only re-arming the counter. The device then stays open until close() is called (or the with block exits). False opens, resets, sets up and closes the device every cycle",
+            },
+            "stream_buffers": {
+                "_value": 2,
+                "_description": "Number of preallocated transfer buffers cycled through while streaming, 2 for double buffering. More buffers let the consumer lag further behind before the counter stalls",
+            },
+            "backend": {
+                "_value": "windll",
+                "_description": "Library backend: windll for the vendor DLL, cdll for a locally built stand-in at dll_path, or emulator for the in-process Poisson emulator",
+            },
             "dll_path": {
                 "_value": "/path/to/dll",
                 "_description": "DLL path to use for C8855 photon counter",
             },
+            "emulator_rate": {
+                "_value": 100000.0,
+                "_description": "Emulator count rate in counts per second, or a list with one rate per gate",
+            },
+            "emulator_latency": {
+                "_value": 0.0,
+                "_description": "Emulator transfer time in seconds added to every read",
+            },
+            "emulator_setup_latency": {
+                "_value": 0.0,
+                "_description": "Emulator time in seconds taken by each open, reset, setup and close call",
+            },
+            "emulator_realtime": {
+                "_value": True,
+                "_description": "Whether emulator reads wait for the gates to elapse",
+            },
+            "emulator_seed": {
+                "_value": -1,
+                "_description": "Seed of the emulator counts, for reproducible runs. -1 draws a fresh seed",
+            },
         }
     }
 
@@ -118,6 +176,11 @@ class C8855_counting_unit(RexSupport):
         super().__init__(name=name)
         self.bind_config(config)
         self.connect_to_rex = connect_to_rex
+        self.device_handle = None
+        self._stream_thread = None
+        self._stream_error = None
+        self.stream_stalls = 0
+        self.stream_discarded = 0
 
         if self.connect_to_rex:
             self.sock = self.tcp_connect()
@@ -129,7 +192,11 @@ class C8855_counting_unit(RexSupport):
         self.setup_config()
 
     def setup_config(self):
-        """Loads device configuration and initializes the DLL functions."""
+        """Loads device configuration and the library backend. Closes any open session, so the new settings are applied on the next measurement."""
+        if self.streaming:
+            self.stop_stream()
+        if self.device_handle:
+            self.close_session()
         self.number_of_gates = self.require_config("number_of_gates")
         self.transfer_type = self.transfer_type_mapping[
             self.require_config("transfer_type")
@@ -139,39 +206,37 @@ class C8855_counting_unit(RexSupport):
             self.require_config("trigger_type")
         ]
         self.cycles = self.require_config("cycles")
+        self.target_relative_error = self.config.get("target_relative_error", 0.0)
+        self.min_cycles = max(2, int(self.config.get("min_cycles", 2)))
+        self.statistics = BinStatistics(self.number_of_gates)
         self.measure_mode = self.require_config("measure_mode")
-        dll_path = self.require_config("dll_path")
-        self.dll = ctypes.WinDLL(dll_path)
-        self.dll.C8855CountStop.argtypes = [ctypes.c_void_p]
-        self.dll.C8855CountStop.restype = ctypes.c_bool
-        self.dll.C8855ReadData.argtypes = [
-            ctypes.c_void_p,
-            ctypes.POINTER(ctypes.c_ulong),
-            ctypes.POINTER(ctypes.c_ubyte),
-        ]
-        self.dll.C8855ReadData.restype = ctypes.c_bool
-        self.dll.C8855CountStart.argtypes = [ctypes.c_void_p, ctypes.c_ubyte]
-        self.dll.C8855CountStart.restype = ctypes.c_bool
-        self.dll.C8855Setup.argtypes = [
-            ctypes.c_void_p,
-            ctypes.c_ubyte,
-            ctypes.c_ubyte,
-            ctypes.c_ushort,
-        ]
-        self.dll.C8855Setup.restype = ctypes.c_bool
-        self.dll.C8855Close.argtypes = [ctypes.c_void_p]
-        self.dll.C8855Close.restype = ctypes.c_bool
-        self.dll.C8855Reset.argtypes = [ctypes.c_void_p]
-        self.dll.C8855Reset.restype = ctypes.c_bool
-        self.dll.C8855Open.argtypes = []
-        self.dll.C8855Open.restype = (
-            ctypes.c_void_p
-        )  # Assuming the handle is a void pointer
+        self.session = self.config.get("session", False)
+        self.stream_buffers = max(2, int(self.config.get("stream_buffers", 2)))
+        # transfer buffer shared by every cycle, read through a numpy view of its memory
+        self.data_buffer = (ctypes.c_ulong * 1024)()
+        self.buffer_view = np.ctypeslib.as_array(self.data_buffer)
+        self.backend = self.config.get("backend", "windll")
+        if self.backend == "emulator":
+            seed = self.config.get("emulator_seed", -1)
+            self.dll = load_backend(
+                "emulator",
+                rate=self.config.get("emulator_rate", 1e5),
+                latency=self.config.get("emulator_latency", 0.0),
+                setup_latency=self.config.get("emulator_setup_latency", 0.0),
+                realtime=self.config.get("emulator_realtime", True),
+                seed=None if seed < 0 else seed,
+            )
+        else:
+            self.dll = load_backend(self.backend, self.require_config("dll_path"))
 
     def general_measurement(self):
         """
-        Performs a single measurement cycle, including resetting, setting up, starting, reading, and stopping.
+        Performs a single measurement cycle. In session mode the counter is only re-armed, started, read and stopped,
+        otherwise the device is opened, reset, set up and closed again every cycle.
         """
+        if self.session:
+            self.session_measurement()
+            return
 
         self.device_handle = self.open_device()
 
@@ -203,10 +268,7 @@ class C8855_counting_unit(RexSupport):
         else:
             self.logger.error("C8855 Start failed.")
 
-        data_buffer = (ctypes.c_ulong * 1024)()
-        overall_start_time = time.time()
-
-        self.read_data(self.device_handle, data_buffer)
+        self.read_data(self.device_handle, self.data_buffer)
 
         success = self.stop_counting(self.device_handle)
         if success:
@@ -215,11 +277,7 @@ class C8855_counting_unit(RexSupport):
             self.logger.error("Counting stop failed.")
         time.sleep(0.1)
 
-        self.bin_counts = np.asarray(list(data_buffer))
-        self.bin_counts = self.bin_counts[: 512 - (512 - self.number_of_gates)]
-        self.counts = np.sum(self.bin_counts)
-        self.bin_cycles += self.bin_counts
-        self.total_counts += self.counts
+        self.accumulate(self.buffer_view)
 
         success = self.reset_device(self.device_handle)
         if success:
@@ -227,6 +285,239 @@ class C8855_counting_unit(RexSupport):
         else:
             self.logger.error("C8855 Reset failed.")
 
+        if self.device_handle:
+            if not self.close_device(self.device_handle):
+                self.logger.error("C8855 Close failed.")
+            self.device_handle = None
+
+    def session_measurement(self):
+        """
+        Performs a single measurement cycle on the open session, opening it first if needed. The device keeps its setup
+        between cycles, so only starting, reading and stopping the counter is needed and the cycle time is set by the gates.
+        """
+        self.open_session()
+
+        if not self.start_counting(self.device_handle, self.trigger_type):
+            self.close_session()
+            raise DeviceError("C8855 Start failed.")
+
+        self.read_data(self.device_handle, self.data_buffer)
+
+        if not self.stop_counting(self.device_handle):
+            self.logger.error("Counting stop failed.")
+
+        self.accumulate(self.buffer_view)
+
+    def accumulate(self, block: np.ndarray):
+        """
+        Adds the gates of a transfer buffer to the histogram of the current measurement, in place.
+
+        Args:
+            block (np.ndarray): The transfer buffer, viewed as an array.
+        """
+        self.bin_counts = block[: self.number_of_gates]
+        self.counts = self.bin_counts.sum()
+        self.bin_cycles += self.bin_counts
+        self.statistics.update(self.bin_counts)
+
+    def converged(self) -> bool:
+        """
+        Whether the relative standard error of the total counts has reached target_relative_error.
+
+        Returns:
+            bool: True if early stopping is enabled, at least min_cycles cycles have been taken and the target is met.
+        """
+        return (
+            self.target_relative_error > 0
+            and self.statistics.count >= self.min_cycles
+            and self.statistics.relative_error <= self.target_relative_error
+        )
+
+    def trace_error(self) -> np.ndarray:
+        """
+        Standard error of the summed trace of the current measurement, from the spread between cycles.
+        Falls back to the Poisson error sqrt(counts) while fewer than two cycles have been taken.
+
+        Returns:
+            np.ndarray: Error of the counts in each gate.
+        """
+        if self.statistics.count < 2:
+            return np.sqrt(self.bin_cycles, dtype=np.float64)
+        return self.statistics.sem * self.statistics.count
+
+    def open_session(self):
+        """
+        Opens, resets and sets up the device once, keeping the handle for the following cycles. Does nothing if a session is already open.
+        """
+        if self.device_handle:
+            return
+        self.device_handle = self.open_device()
+        if not self.device_handle:
+            self.device_handle = None
+            raise DeviceError("Device handle not obtained. Initialization failed.")
+        if not self.reset_device(self.device_handle):
+            self.logger.error("C8855 Reset failed.")
+        if not self.setup_device(
+            self.device_handle,
+            gate_time=self.gate_time,
+            transfer_mode=self.transfer_type,
+            number_of_gates=self.number_of_gates,
+        ):
+            self.close_session()
+            raise DeviceError("Device setup failed.")
+        self.logger.debug("C8855 session opened.")
+
+    def close_session(self):
+        """
+        Resets and closes the device if a session is open.
+        """
+        if not self.device_handle:
+            return
+        if not self.reset_device(self.device_handle):
+            self.logger.error("C8855 Reset failed.")
+        if not self.close_device(self.device_handle):
+            self.logger.error("C8855 Close failed.")
+        self.device_handle = None
+        self.logger.debug("C8855 session closed.")
+
+    @property
+    def streaming(self) -> bool:
+        return self._stream_thread is not None
+
+    def start_stream(self):
+        """
+        Starts continuous acquisition on a background thread.
+
+        The thread keeps the counter armed and reads gate blocks into preallocated transfer buffers, alternating
+        between them so the next block is read while the previous one is consumed. Completed blocks are consumed
+        with stream(), and measure() accumulates its cycles from the stream while it is running.
+        """
+        if self.streaming:
+            return
+        self.open_session()
+        self._stream_free = queue.Queue()
+        self._stream_filled = queue.Queue()
+        for _ in range(self.stream_buffers):
+            self._stream_free.put((ctypes.c_ulong * 1024)())
+        self._stream_stop = threading.Event()
+        self._stream_error = None
+        self.stream_stalls = 0
+        self.stream_discarded = 0
+        self._stream_thread = threading.Thread(
+            target=self._stream_worker, name=f"{self.name}-stream", daemon=True
+        )
+        self._stream_thread.start()
+        self.logger.debug(f"C8855 streaming started with {self.stream_buffers} buffers.")
+
+    def stop_stream(self, timeout: float = None):
+        """
+        Stops continuous acquisition, waiting for the block being read to complete. Blocks not yet consumed are discarded.
+
+        A read waiting on an external trigger that never comes is aborted by stopping the counter once the timeout
+        has passed, and if the thread is still stuck after that it is abandoned with an error logged, so closing
+        the device never hangs.
+
+        Args:
+            timeout (float, optional): Time in seconds to wait for the block being read. Defaults to one block plus 1s.
+        """
+        if not self.streaming:
+            return
+        if timeout is None:
+            timeout = GATE_TIME_SECONDS[self.gate_time] * self.number_of_gates + 1.0
+        self._stream_stop.set()
+        self._stream_thread.join(timeout)
+        if self._stream_thread.is_alive():
+            self.logger.warning(
+                f"C8855 read still pending after {timeout:.1f}s, stopping the counter to abort it"
+            )
+            self.stop_counting(self.device_handle)
+            self._stream_thread.join(1.0)
+            if self._stream_thread.is_alive():
+                self.logger.error(
+                    "C8855 streaming thread did not stop, abandoning it blocked in C8855ReadData"
+                )
+        self._stream_thread = None
+        self.logger.debug("C8855 streaming stopped.")
+
+    def stream(self, blocks: int = None, since: float = None):
+        """
+        Yields completed gate blocks from the streaming thread, starting it if needed.
+
+        Args:
+            blocks (int, optional): Number of blocks to yield. Yields until the stream is stopped if None.
+            since (float, optional): time.perf_counter() before which blocks must not have started counting. Older
+                blocks, such as those acquired while the caller was moving a stage, are discarded. Defaults to keeping every block.
+
+        Yields:
+            np.ndarray: Counts of each gate in the block.
+        """
+        self.start_stream()
+        yielded = 0
+        while blocks is None or yielded < blocks:
+            try:
+                data_buffer, started = self._stream_filled.get(timeout=0.1)
+            except queue.Empty:
+                if self._stream_error is not None:
+                    raise DeviceError(f"C8855 streaming failed: {self._stream_error}")
+                if not self.streaming or not self._stream_thread.is_alive():
+                    return
+                continue
+            if since is not None and started < since:
+                self.stream_discarded += 1
+                self._stream_free.put(data_buffer)
+                continue
+            block = np.ctypeslib.as_array(data_buffer)[: self.number_of_gates].copy()
+            self._stream_free.put(data_buffer)
+            yielded += 1
+            yield block
+
+    def _stream_worker(self):
+        try:
+            if not self.start_counting(self.device_handle, self.trigger_type):
+                raise DeviceError("C8855 Start failed.")
+            # blocks follow each other back to back, so each starts counting when the previous one completed
+            started = time.perf_counter()
+            while not self._stream_stop.is_set():
+                try:
+                    data_buffer = self._stream_free.get_nowait()
+                except queue.Empty:
+                    # the consumer holds every buffer, counting stalls until one is released
+                    self.stream_stalls += 1
+                    data_buffer = None
+                    while data_buffer is None and not self._stream_stop.is_set():
+                        try:
+                            data_buffer = self._stream_free.get(timeout=0.1)
+                        except queue.Empty:
+                            pass
+                    if data_buffer is None:
+                        break
+                if not self.read_data(self.device_handle, data_buffer):
+                    if self._stream_stop.is_set():
+                        break  # read aborted by stop_stream
+                    raise DeviceError("C8855 ReadData failed.")
+                self._stream_filled.put((data_buffer, started))
+                started = time.perf_counter()
+        except Exception as e:
+            self.logger.error(f"C8855 streaming stopped: {e}")
+            self._stream_error = e
+        finally:
+            if not self.stop_counting(self.device_handle):
+                self.logger.error("Counting stop failed.")
+
+    def close(self):
+        """
+        Stops streaming and closes the device session, after sending anything still queued for rex.
+        """
+        self.flush_rex()
+        self.stop_stream()
+        self.close_session()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
     def stop_counting(self, handle: ctypes.c_void_p) -> bool:
         """
         Stops the photon counting process.
@@ -241,19 +532,41 @@ class C8855_counting_unit(RexSupport):
 
     def measure(self):
         """
-        Conducts multiple measurements based on the configured number of cycles.
+        Conducts multiple measurements based on the configured number of cycles, stopping early once
+        target_relative_error is reached if it is set. In trace modes the error of the trace is reported as trace_error.
 
         Returns:
             float | tuple: Depending on measure_mode, returns either total count, trace data, or both.
         """
-        self.bin_cycles = 0
-        self.total_counts = 0
+        called = time.perf_counter()
+        # a new histogram per measurement, as the previous one may still be queued for rex
+        self.bin_cycles = np.zeros(self.number_of_gates, dtype=np.uint64)
+        self.statistics.reset()
         if self.cycles == 0:
             self.cycles = 1
 
-        for i in range(self.cycles):
-            self.general_measurement()
+        if self.streaming:
+            # blocks counted before this call, e.g. during the previous stage move, are dropped
+            for block in self.stream(self.cycles, since=called):
+                self.accumulate(block)
+                if self.converged():
+                    break
+        else:
+            for i in range(self.cycles):
+                self.general_measurement()
+                if self.converged():
+                    break
+        self.cycles_measured = self.statistics.count
+        if self.target_relative_error > 0:
+            self.logger.debug(
+                f"Took {self.cycles_measured} cycles, relative error {self.statistics.relative_error:.3g}"
+            )
+            self.measurements["cycles_measured"] = Measurement(
+                data=[self.cycles_measured],
+                unit="dimensionless",
+            )
 
+        self.total_counts = int(self.bin_cycles.sum())
         bin_average_array = self.bin_cycles
         count_average = self.total_counts
         # only return counts until trace data is implemented in rex
@@ -265,10 +578,14 @@ class C8855_counting_unit(RexSupport):
                 )
 
             case "trace":
-                self.measurements["trace"] = Measurement(
+                self.measurements["trace"] = ArrayMeasurement(
                     data=bin_average_array,
                     unit="counts",
                 )
+                self.measurements["trace_error"] = ArrayMeasurement(
+                    data=self.trace_error(),
+                    unit="counts",
+                )
 
                 self.measurements["counts"].data = []
 
@@ -278,16 +595,18 @@ class C8855_counting_unit(RexSupport):
                     unit="dimensionless",
                 )
 
-                self.measurements["trace"] = Measurement(
+                self.measurements["trace"] = ArrayMeasurement(
                     data=bin_average_array,
                     unit="counts",
                 )
+                self.measurements["trace_error"] = ArrayMeasurement(
+                    data=self.trace_error(),
+                    unit="counts",
+                )
 
             case _:
                 raise DeviceError("Measurement mode not specified correctly")
-        if self.connect_to_rex:
-            payload = self.create_payload()
-            self.tcp_send(payload, self.sock)
+        self.publish_measurements()
 
         match self.measure_mode:
             case "all":
@@ -371,13 +690,16 @@ class C8855_counting_unit(RexSupport):
         """
         return self.dll.C8855CountStart(handle, trigger_mode)
 
-    def read_data(self, handle: ctypes.c_void_p, data_buffer: Pointer_c_ulong):
+    def read_data(self, handle: ctypes.c_void_p, data_buffer: Pointer_c_ulong) -> bool:
         """
         Reads data from the device into the provided buffer.
 
         Args:
             handle (ctypes.c_void_p): Device handle.
             data_buffer (Pointer_c_ulong): Buffer to store retrieved data.
+
+        Returns:
+            bool: True if the read succeeded, False otherwise.
         """
         result_returned = ctypes.c_ubyte()
-        _ = self.dll.C8855ReadData(handle, data_buffer, ctypes.byref(result_returned))
+        return self.dll.C8855ReadData(handle, data_buffer, ctypes.byref(result_returned))
@@ -0,0 +1,17 @@
+from .backends import (
+    BACKENDS,
+    GATE_TIME_SECONDS,
+    C8855Emulator,
+    bind_prototypes,
+    load_backend,
+)
+from .statistics import BinStatistics
+
+__all__ = [
+    "BACKENDS",
+    "GATE_TIME_SECONDS",
+    "BinStatistics",
+    "C8855Emulator",
+    "bind_prototypes",
+    "load_backend",
+]
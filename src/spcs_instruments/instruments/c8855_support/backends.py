@@ -0,0 +1,208 @@
+import ctypes
+import time
+
+import numpy as np
+
+BACKENDS = ("windll", "cdll", "emulator")
+
+# gate time codes of the C8855 API in seconds
+GATE_TIME_SECONDS = {
+    0x02: 50e-6,
+    0x03: 100e-6,
+    0x04: 200e-6,
+    0x05: 500e-6,
+    0x06: 1e-3,
+    0x07: 2e-3,
+    0x08: 5e-3,
+    0x09: 10e-3,
+    0x0A: 20e-3,
+    0x0B: 50e-3,
+    0x0C: 100e-3,
+    0x0D: 200e-3,
+    0x0E: 500e-3,
+    0x0F: 1.0,
+    0x10: 2.0,
+    0x11: 5.0,
+    0x12: 10.0,
+}
+
+
+def load_backend(backend: str = "windll", dll_path: str = None, **emulator_options):
+    """
+    Loads the library the C8855 driver calls into.
+
+    Every backend exposes the C8855 API functions (C8855Open, C8855Reset, C8855Setup, C8855CountStart,
+    C8855ReadData, C8855CountStop and C8855Close) with the signatures of the vendor DLL.
+
+    Args:
+        backend (str, optional): 'windll' loads the vendor DLL, 'cdll' loads a locally built stand-in
+            with the C calling convention, 'emulator' uses the in-process C8855Emulator. Defaults to 'windll'.
+        dll_path (str, optional): Path of the library, required for the windll and cdll backends.
+        **emulator_options: Keyword arguments passed to C8855Emulator.
+
+    Returns:
+        The loaded library or the emulator.
+    """
+    match backend:
+        case "windll":
+            return bind_prototypes(ctypes.WinDLL(dll_path))
+        case "cdll":
+            return bind_prototypes(ctypes.CDLL(dll_path))
+        case "emulator":
+            return C8855Emulator(**emulator_options)
+        case _:
+            raise ValueError(
+                f"Unknown C8855 backend {backend!r}, options: {', '.join(BACKENDS)}"
+            )
+
+
+def bind_prototypes(library):
+    """
+    Declares the argument and return types of the C8855 API functions of a ctypes library.
+
+    Args:
+        library (ctypes.CDLL): The loaded library.
+
+    Returns:
+        ctypes.CDLL: The same library.
+    """
+    library.C8855CountStop.argtypes = [ctypes.c_void_p]
+    library.C8855CountStop.restype = ctypes.c_bool
+    library.C8855ReadData.argtypes = [
+        ctypes.c_void_p,
+        ctypes.POINTER(ctypes.c_ulong),
+        ctypes.POINTER(ctypes.c_ubyte),
+    ]
+    library.C8855ReadData.restype = ctypes.c_bool
+    library.C8855CountStart.argtypes = [ctypes.c_void_p, ctypes.c_ubyte]
+    library.C8855CountStart.restype = ctypes.c_bool
+    library.C8855Setup.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_ubyte,
+        ctypes.c_ubyte,
+        ctypes.c_ushort,
+    ]
+    library.C8855Setup.restype = ctypes.c_bool
+    library.C8855Close.argtypes = [ctypes.c_void_p]
+    library.C8855Close.restype = ctypes.c_bool
+    library.C8855Reset.argtypes = [ctypes.c_void_p]
+    library.C8855Reset.restype = ctypes.c_bool
+    library.C8855Open.argtypes = []
+    library.C8855Open.restype = ctypes.c_void_p  # Assuming the handle is a void pointer
+    return library
+
+
+class C8855Emulator:
+    """
+    In-process stand-in for the C8855 DLL, for running and profiling the driver without hardware.
+
+    Gate counts are Poisson distributed around `rate` counts per second. Once counting has started
+    gate blocks complete back to back, so with `realtime` enabled C8855ReadData blocks until the
+    next block of number_of_gates x gate time has elapsed, like the hardware does.
+
+    Attributes:
+        rate (float | np.ndarray): Count rate in counts per second, either one rate for every gate or one per gate.
+        latency (float): Transfer time in seconds added to every C8855ReadData call.
+        setup_latency (float): Time in seconds each of C8855Open, C8855Reset, C8855Setup and C8855Close take.
+        realtime (bool): Whether C8855ReadData waits for the gates to elapse.
+        calls (dict): Number of calls made to each API function.
+    """
+
+    def __init__(
+        self,
+        rate=1e5,
+        latency: float = 0.0,
+        setup_latency: float = 0.0,
+        realtime: bool = True,
+        seed: int = None,
+    ):
+        """
+        Args:
+            rate (float | list[float], optional): Count rate in counts per second, or one rate per gate. Defaults to 1e5.
+            latency (float, optional): Transfer time in seconds per C8855ReadData call. Defaults to 0.
+            setup_latency (float, optional): Time in seconds per open, reset, setup and close call. Defaults to 0.
+            realtime (bool, optional): Whether reads wait for the gates to elapse. Defaults to True.
+            seed (int, optional): Seed of the count generator.
+        """
+        self.rate = np.asarray(rate, dtype=np.float64)
+        self.latency = latency
+        self.setup_latency = setup_latency
+        self.realtime = realtime
+        self.calls = dict.fromkeys(
+            (
+                "C8855Open",
+                "C8855Reset",
+                "C8855Setup",
+                "C8855CountStart",
+                "C8855ReadData",
+                "C8855CountStop",
+                "C8855Close",
+            ),
+            0,
+        )
+        self._rng = np.random.default_rng(seed)
+        self._gate_seconds = GATE_TIME_SECONDS[0x05]
+        self._number_of_gates = 512
+        self._counting = False
+        self._block_end = 0.0
+
+    @property
+    def block_seconds(self) -> float:
+        """Duration of one block of gates in seconds."""
+        return self._gate_seconds * self._number_of_gates
+
+    def C8855Open(self):
+        self._call("C8855Open", self.setup_latency)
+        return 1
+
+    def C8855Reset(self, handle) -> bool:
+        self._call("C8855Reset", self.setup_latency)
+        self._counting = False
+        return True
+
+    def C8855Setup(self, handle, gate_time, transfer_mode, number_of_gates) -> bool:
+        self._call("C8855Setup", self.setup_latency)
+        if gate_time not in GATE_TIME_SECONDS:
+            return False
+        self._gate_seconds = GATE_TIME_SECONDS[gate_time]
+        self._number_of_gates = number_of_gates
+        return True
+
+    def C8855CountStart(self, handle, trigger_mode) -> bool:
+        self._call("C8855CountStart")
+        self._counting = True
+        self._block_end = time.perf_counter() + self.block_seconds
+        return True
+
+    def C8855ReadData(self, handle, data_buffer, result_returned=None) -> bool:
+        self._call("C8855ReadData", self.latency)
+        if not self._counting:
+            return False
+        if self.realtime:
+            now = time.perf_counter()
+            if self._block_end > now:
+                time.sleep(self._block_end - now)
+            # a reader that fell behind only gets the block completing next
+            self._block_end = max(self._block_end, now) + self.block_seconds
+        expected = np.broadcast_to(
+            self.rate * self._gate_seconds, (self._number_of_gates,)
+        )
+        buffer = np.ctypeslib.as_array(data_buffer)
+        buffer[: self._number_of_gates] = self._rng.poisson(expected)
+        buffer[self._number_of_gates :] = 0
+        return True
+
+    def C8855CountStop(self, handle) -> bool:
+        self._call("C8855CountStop")
+        self._counting = False
+        return True
+
+    def C8855Close(self, handle) -> bool:
+        self._call("C8855Close", self.setup_latency)
+        self._counting = False
+        return True
+
+    def _call(self, name: str, latency: float = 0.0) -> None:
+        self.calls[name] += 1
+        if latency:
+            time.sleep(latency)
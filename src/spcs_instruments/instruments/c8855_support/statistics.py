@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class BinStatistics:
+    """
+    Running per-gate statistics of the counts of successive cycles.
+
+    Uses Welford's algorithm, vectorised over the gates, so the mean, variance and standard error
+    of every gate are available at any point without keeping the individual cycles. The total
+    counts per cycle are tracked the same way, giving the relative error used for early stopping.
+
+    Attributes:
+        count (int): Number of cycles accumulated.
+        mean (np.ndarray): Mean counts per cycle of each gate.
+        total_mean (float): Mean total counts per cycle.
+    """
+
+    def __init__(self, number_of_gates: int):
+        """
+        Args:
+            number_of_gates (int): Number of gates per cycle.
+        """
+        self.mean = np.zeros(number_of_gates, dtype=np.float64)
+        self._m2 = np.zeros(number_of_gates, dtype=np.float64)
+        self._delta = np.empty(number_of_gates, dtype=np.float64)
+        self.reset()
+
+    def reset(self) -> None:
+        """Discards all accumulated cycles."""
+        self.count = 0
+        self.mean.fill(0.0)
+        self._m2.fill(0.0)
+        self.total_mean = 0.0
+        self._total_m2 = 0.0
+
+    def update(self, counts: np.ndarray) -> None:
+        """
+        Adds the counts of one cycle.
+
+        Args:
+            counts (np.ndarray): Counts of each gate.
+        """
+        self.count += 1
+        np.subtract(counts, self.mean, out=self._delta)
+        self.mean += self._delta / self.count
+        # m2 += delta * (x - new mean), reusing the delta buffer for the second factor
+        self._delta *= counts - self.mean
+        self._m2 += self._delta
+
+        total = float(np.sum(counts))
+        delta = total - self.total_mean
+        self.total_mean += delta / self.count
+        self._total_m2 += delta * (total - self.total_mean)
+
+    @property
+    def variance(self) -> np.ndarray:
+        """Sample variance of each gate's counts per cycle, NaN before two cycles."""
+        if self.count < 2:
+            return np.full_like(self.mean, np.nan)
+        return self._m2 / (self.count - 1)
+
+    @property
+    def sem(self) -> np.ndarray:
+        """Standard error of each gate's mean counts per cycle."""
+        return np.sqrt(self.variance / self.count)
+
+    @property
+    def total_sem(self) -> float:
+        """Standard error of the mean total counts per cycle, NaN before two cycles."""
+        if self.count < 2:
+            return float("nan")
+        return float(np.sqrt(self._total_m2 / (self.count - 1) / self.count))
+
+    @property
+    def relative_error(self) -> float:
+        """Relative standard error of the total counts, infinite until it can be estimated."""
+        if self.count < 2 or self.total_mean == 0:
+            return float("inf")
+        return self.total_sem / self.total_mean
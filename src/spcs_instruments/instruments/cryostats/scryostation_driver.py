@@ -1,11 +1,12 @@
 import time
 
-from rex_utils import DeviceError, Measurement, RexSupport
+from rex_utils import DeviceError, Measurement
 
+from ...rex_support import SpcsRexSupport
 from .montana_support import scryostation
 
 
-class Scryostation(RexSupport):
+class Scryostation(SpcsRexSupport):
     """
     A class to manage and control a cryostation system, including its configuration,
     initialization, and operational states such as bake-out, purging, and cooldown.
@@ -349,7 +350,5 @@ class Scryostation(RexSupport):
         )
         self.measurements["magnetic field (mT)"] = Measurement(data=[field], unit="mT")
 
-        if self.connect_to_rex:
-            payload = self.create_payload()
-            self.tcp_send(payload, self.sock)
+        self.publish_measurements()
         return self.measurements
@@ -1,9 +1,11 @@
 import random as rd
 
-from rex_utils import Measurement, RexSupport
+from rex_utils import Measurement
 
+from ...rex_support import SpcsRexSupport
 
-class Test_cryostat(RexSupport):
+
+class Test_cryostat(SpcsRexSupport):
     def __init__(self, config, name="Test_cryostat", emulate=True, connect_to_rex=True):
         """
         A simulated device
@@ -54,9 +56,7 @@ class Test_cryostat(RexSupport):
             data=[field_strength], unit="mT"
         )
 
-        if self.connect_to_rex:
-            payload = self.create_payload()
-            self.tcp_send(payload, self.sock)
+        self.publish_measurements()
         return self.measurements
 
     def goto_setpoint(self, setpoint):
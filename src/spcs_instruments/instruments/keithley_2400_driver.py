@@ -1,35 +1,39 @@
+import time
+
+import numpy as np
 import pyvisa
-from rex_utils import Measurement, RexSupport
+from rex_utils import Measurement
+
+from ..rex_support import ArrayMeasurement, SpcsRexSupport
+from .visa_support import find_resource
+
 
+class Keithley2400(SpcsRexSupport):
+    # measurement name and unit of each :FORM:ELEM reading element, in the order the instrument returns them
+    READING_ELEMENTS = {
+        "VOLT": ("voltage (mV)", "mV"),
+        "CURR": ("current (mA)", "mA"),
+        "RES": ("resistance (Ω)", "ohm"),
+        "TIME": ("timestamp (s)", "s"),
+        "STAT": ("status", "dimensionless"),
+    }
+    # :FORM:DATA binary formats and their struct datatypes
+    BINARY_FORMATS = {"REAL,32": "f", "REAL,64": "d"}
+    MAX_BUFFER_POINTS = 2500
+    MAX_LIST_POINTS = 100
 
-class Keithley2400(RexSupport):
     def __init__(self, config, name="Keithley2400", connect_to_rex=True):
         super().__init__(name=name)
         self.bind_config(config)
         self.connect_to_rex = connect_to_rex
         rm = pyvisa.ResourceManager()
         self.resource_adress = "not found"
-        resources = rm.list_resources()
-        self.measurements = {
-            "voltage (mV)": Measurement(data=[], unit="mV"),
-            "current (mA)": Measurement(data=[], unit="mA"),
-            "resistance (Ω)": Measurement(data=[], unit="ohm"),
-            "timestamp (s)": Measurement(data=[], unit="s"),
-            "status": Measurement(data=[], unit="dimensionless"),
-        }
-        for i in range(len(resources)):
-            try:
-                my_instrument = rm.open_resource(resources[i])
-                my_instrument.read_termination = "\r"
-                query = my_instrument.query("*IDN?").strip()
-
-                if "KEITHLEY INSTRUMENTS INC.,MODEL 2400" in query:
-                    self.resource_adress = resources[i]
-                    self.instrument = my_instrument
-                    self.logger.debug("Keithley Found!")
-
-            except:
-                pass
+        self.instrument = find_resource(
+            rm, "KEITHLEY INSTRUMENTS INC.,MODEL 2400", read_termination="\r"
+        )
+        if self.instrument is not None:
+            self.resource_adress = self.instrument.resource_name
+            self.logger.debug("Keithley Found!")
 
         if self.resource_adress == "not found":
             self.logger.error(
@@ -49,6 +53,10 @@ class Keithley2400(RexSupport):
     def configure_device(self):
         # Access the measurement settings
         self.measurement_settings = self.config["measurement"]
+        # Leave the output on between readings instead of cycling the relay for every point
+        self.keep_output_on = self.measurement_settings.get("keep_output_on", False)
+        self.settle_delay = self.measurement_settings.get("settle_delay", 0.0)
+        self.output_on = False
         # NEED TO ADD RESET
         # Example configuration commands
         self.instrument.write(
@@ -92,60 +100,207 @@ class Keithley2400(RexSupport):
                 f":SENS:{self.measurement_settings['sense_mode']}:RANG {self.measurement_settings['measurecurrent_range']}"
             )  # Measure voltage range
 
+        # Reading elements returned, and whether they are transferred as ASCII or binary
+        self.elements = [
+            element.upper()
+            for element in self.measurement_settings.get(
+                "elements", list(self.READING_ELEMENTS)
+            )
+        ]
+        unknown = set(self.elements) - set(self.READING_ELEMENTS)
+        if unknown or not self.elements:
+            raise ValueError(
+                f"elements must be a selection of {list(self.READING_ELEMENTS)}, got {self.elements}"
+            )
+        # the instrument always returns the selected elements in its own order
+        self.elements = [e for e in self.READING_ELEMENTS if e in self.elements]
+        self.data_format = self.measurement_settings.get("data_format", "ASCII").upper()
+        if self.data_format != "ASCII" and self.data_format not in self.BINARY_FORMATS:
+            raise ValueError(
+                f"data_format must be ASCII or one of {list(self.BINARY_FORMATS)}, got {self.data_format}"
+            )
+        self.instrument.write(f":FORM:ELEM {','.join(self.elements)}")
+        if self.data_format == "ASCII":
+            self.instrument.write(":FORM:DATA ASC")
+        else:
+            self.instrument.write(f":FORM:DATA {self.data_format}")
+            self.instrument.write(":FORM:BORD SWAP")  # little-endian, native on the host
+
+        self.measurements = {
+            name: Measurement(data=[], unit=unit)
+            for name, unit in (self.READING_ELEMENTS[e] for e in self.elements)
+        }
+
     def measure(self):
-        # Turn on the output
-        self.instrument.write(":OUTP ON")
+        # Turn on the output, in keep_output_on mode only for the first reading
+        if not self.output_on:
+            self.set_output(True)
 
         # Trigger a measurement
-        measurement = self.instrument.query(":READ?").strip()
+        reading = self.read_values(":READ?")[0]
 
         # Turn off the output
-        self.instrument.write(":OUTP OFF")
+        if not self.keep_output_on:
+            self.set_output(False)
 
         # Store the measurement
+        for element, value in zip(self.elements, reading):
+            name, unit = self.READING_ELEMENTS[element]
+            self.measurements[name] = Measurement(
+                data=[float(value)],
+                unit=unit,
+            )
 
-        measurement_values = measurement.split(",")
-        V = float(measurement_values[0])  # Convert the first value to a float
+        self.publish_measurements()
 
-        I = float(measurement_values[1])
+        return self.measurements
 
-        R = float(measurement_values[2])
+    def set_output(self, enabled: bool):
+        """
+        Turns the source output on or off.
 
-        T = float(measurement_values[3])
+        Args:
+            enabled (bool): Whether the output is on.
+        """
+        self.instrument.write(":OUTP ON" if enabled else ":OUTP OFF")
+        self.output_on = enabled
 
-        S = float(measurement_values[4])
+    def set_level(self, level: float):
+        """
+        Changes the source level, leaving the output and every other setting as they are. With the output kept
+        on this replaces the relay cycle between points, waiting settle_delay seconds for the new level to settle.
 
-        self.measurements["voltage (mV)"] = Measurement(
-            data=[V],
-            unit="mV",
+        Args:
+            level (float): Source level, in amps or volts depending on source_mode.
+        """
+        self.instrument.write(
+            f":SOUR:{self.measurement_settings['source_mode']}:LEV {level}"
         )
+        if self.output_on and self.settle_delay:
+            time.sleep(self.settle_delay)
 
-        self.measurements["current (mA)"] = Measurement(
-            data=[I],
-            unit="mA",
-        )
+    def sweep(
+        self,
+        start: float = None,
+        stop: float = None,
+        points: int = None,
+        spacing: str = "LIN",
+        values=None,
+        delay: float = None,
+        timeout: float = None,
+    ) -> dict:
+        """
+        Runs a hardware source sweep and fetches every reading from the trace buffer in a single transfer.
 
-        self.measurements["resistance (Ω)"] = Measurement(
-            data=[R],
-            unit="ohm",
-        )
+        The instrument steps the source and stores a reading per point by itself, so the sweep runs at the
+        SMU's source delay and integration time rather than one bus round trip per point. Either start, stop
+        and points give a linear or log staircase sweep, or values gives a list sweep.
 
-        self.measurements["timestamp (s)"] = Measurement(
-            data=[T],
-            unit="s",
-        )
+        Args:
+            start (float, optional): First source level of a staircase sweep.
+            stop (float, optional): Last source level of a staircase sweep.
+            points (int, optional): Number of points of a staircase sweep, at most 2500.
+            spacing (str, optional): Staircase spacing, LIN or LOG. Defaults to LIN.
+            values (list[float], optional): Source levels of a list sweep, at most 100. Overrides start, stop and points.
+            delay (float, optional): Source delay in seconds before each reading. Leaves the instrument setting unchanged if None.
+            timeout (float, optional): Time in seconds to wait for the sweep to complete. Defaults to 1s per point plus 10s.
 
-        self.measurements["status"] = Measurement(
-            data=[S],
-            unit="dimensionless",
-        )
+        Returns:
+            dict: The measurements, with one ArrayMeasurement per reading element holding a value per point.
+        """
+        source = self.measurement_settings["source_mode"]
+        if values is not None:
+            values = np.asarray(values, dtype=np.float64)
+            points = values.size
+            if not 1 <= points <= self.MAX_LIST_POINTS:
+                raise ValueError(f"List sweeps take 1 to {self.MAX_LIST_POINTS} points, got {points}")
+            self.instrument.write(f":SOUR:{source}:MODE LIST")
+            self.instrument.write(f":SOUR:LIST:{source} {','.join(repr(float(v)) for v in values)}")
+        else:
+            spacing = spacing.upper()
+            if spacing not in ("LIN", "LOG"):
+                raise ValueError(f"Sweep spacing must be LIN or LOG, got {spacing}")
+            if start is None or stop is None or points is None:
+                raise ValueError("Staircase sweeps need start, stop and points")
+            if not 1 <= points <= self.MAX_BUFFER_POINTS:
+                raise ValueError(f"Sweeps take 1 to {self.MAX_BUFFER_POINTS} points, got {points}")
+            self.instrument.write(f":SOUR:{source}:MODE SWE")
+            self.instrument.write(f":SOUR:SWE:SPAC {spacing}")
+            self.instrument.write(":SOUR:SWE:RANG BEST")
+            self.instrument.write(f":SOUR:{source}:STAR {start}")
+            self.instrument.write(f":SOUR:{source}:STOP {stop}")
+            self.instrument.write(f":SOUR:SWE:POIN {points}")
+        if delay is not None:
+            self.instrument.write(f":SOUR:DEL {delay}")
+        self.instrument.write(f":TRIG:COUN {points}")
 
-        if self.connect_to_rex:
-            payload = self.create_payload()
-            self.tcp_send(payload, self.sock)
+        # store every reading in the trace buffer
+        self.instrument.write(":TRAC:CLE")
+        self.instrument.write(f":TRAC:POIN {points}")
+        self.instrument.write(":TRAC:FEED SENS")
+        self.instrument.write(":TRAC:FEED:CONT NEXT")
+
+        previous_timeout = self.instrument.timeout
+        self.instrument.timeout = 1000 * (timeout if timeout is not None else points + 10)
+        try:
+            self.set_output(True)
+            self.instrument.write(":INIT")
+            self.instrument.query("*OPC?")  # returns once the last point has been stored
+        finally:
+            self.instrument.timeout = previous_timeout
+            self.set_output(False)
+            self.instrument.write(f":SOUR:{source}:MODE FIX")
+            self.instrument.write(":TRIG:COUN 1")
+            self.instrument.write(":TRAC:FEED:CONT NEV")
+
+        readings = self.fetch_trace(points)
+        for element, column in zip(self.elements, readings.T):
+            name, unit = self.READING_ELEMENTS[element]
+            self.measurements[name] = ArrayMeasurement(data=column, unit=unit)
+
+        self.publish_measurements()
 
         return self.measurements
 
+    def fetch_trace(self, points: int) -> np.ndarray:
+        """
+        Reads the whole trace buffer in a single transfer.
+
+        Args:
+            points (int): Number of readings stored in the buffer.
+
+        Returns:
+            np.ndarray: One row per stored reading, one column per selected reading element.
+        """
+        return self.read_values(":TRAC:DATA?", points)
+
+    def read_values(self, command: str, points: int = 1) -> np.ndarray:
+        """
+        Queries readings in the configured data format, parsing them straight into numpy.
+
+        Args:
+            command (str): Query returning readings, e.g. :READ? or :TRAC:DATA?.
+            points (int, optional): Number of readings returned. Defaults to 1.
+
+        Returns:
+            np.ndarray: One row per reading, one column per selected reading element.
+        """
+        if self.data_format == "ASCII":
+            data = self.instrument.query_ascii_values(command, container=np.ndarray)
+        else:
+            # the block header does not give its length, so the number of values is passed on
+            data = self.instrument.query_binary_values(
+                command,
+                datatype=self.BINARY_FORMATS[self.data_format],
+                is_big_endian=False,
+                container=np.ndarray,
+                data_points=points * len(self.elements),
+            )
+        return data.reshape(-1, len(self.elements))
+
     def close(self):
-        # Close the instrument connection
+        # Send anything still queued for rex, then close the instrument connection
+        self.flush_rex()
+        if self.output_on:
+            self.set_output(False)
         self.instrument.close()
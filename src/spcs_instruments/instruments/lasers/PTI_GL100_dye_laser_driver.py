@@ -2,10 +2,12 @@ import time
 
 import serial
 import serial.tools.list_ports
-from rex_utils import DeviceError, Measurement, RexSupport
+from rex_utils import DeviceError, Measurement
 
+from ...rex_support import SpcsRexSupport
 
-class Gl100(RexSupport):
+
+class Gl100(SpcsRexSupport):
     """
     A class to control and interface with the PTI tunable dye laser.
 
@@ -262,9 +264,7 @@ class Gl100(RexSupport):
             data=[current_position["wavelength_error"]],
             unit="nm",
         )
-        if self.connect_to_rex:
-            payload = self.create_payload()
-            self.tcp_send(payload, self.sock)
+        self.publish_measurements()
         return self.measurements
 
     def find_correct_port(self, expected_response, baudrate=9600, timeout=2):
@@ -2,22 +2,27 @@ import time
 import numpy as np
 import pyvisa
 
-from rex_utils import Measurement, RexSupport
+from rex_utils import Measurement
 
+from ...rex_support import ArrayMeasurement, SpcsRexSupport
+from .scope_support import DECIMATION_MODES, PreambleCache, WaveformRingBuffer, decimate, decimated_positions
 
-class DPO7104_TekTronix_scope(RexSupport):
+
+class DPO7104_TekTronix_scope(SpcsRexSupport):
     """Driver for the Tektronix DPO7104 oscilloscope over GPIB using PyVISA.
 
     This class manages instrument connection, configuration, gated area integration, waveform
     capture, and optional forwarding of measurement payloads to a Rex server.
 
     The driver supports averaged acquisitions, cursor-based gated area measurements on CH1,
-    raw voltage waveform downloads for CH1 and CH2, and limited trigger setup on CH2. Time axis 
-    must be reconstructed from saved parameters. 
+    raw voltage waveform downloads for CH1 and CH2, and limited trigger setup on CH2. The time axis of each
+    waveform is saved as parameters to reconstruct it from, and for decimated waveforms also as time_from_trigger.
 
     KNOWN FOOTGUNS:
     - Waveform downloads can be slow, massive and may cause the scope's CPU to struggle, or even overfill the computer storage.
-        Used the samples_saved config to reduce the amount saved.
+        Used the samples_saved config to reduce the amount saved. The stride, mean and minmax decimation modes only reduce
+        what is saved, the record is still transferred in full (one block rather than one query per point), use
+        transfer_width 1 to halve the transfer at the cost of vertical resolution.
     - Area measurement pulled from the scope vs area calculated from the pulled waveform can differ if the first 
         cursor is <1.0e-7s or negative, relative to the trigger. This is only an issue if you are setting the cursor 
         tiny and then trying to compare the area measurement to a calculated area from the waveform, if you are just 
@@ -43,14 +48,26 @@ class DPO7104_TekTronix_scope(RexSupport):
         area_enabled (bool): Whether gated area measurements are enabled.
         waveform_enabled (bool): Whether CH1 waveform capture is enabled.
         trigger_enabled (bool): Whether CH2 trigger waveform capture is enabled.
+        completion (str): How the end of an averaged acquisition is detected, srq or poll.
+        completion_latency (float): Time in seconds the last averaged acquisition took to complete, also published as the completion_latency measurement.
+        completion_queries (int): Number of queries made while waiting for the last acquisition.
+        decimation (str): How waveforms are reduced to samples_saved points, one of stride, mean, minmax or step.
+        preamble (PreambleCache): Cached waveform scaling and time axis parameters, per channel.
+        ring (WaveformRingBuffer | None): Memory-mapped ring the scaled waveforms are written into, allocated on the first waveform pull.
+        waveform_sequence (int | None): Ring sequence number of the last waveform pulled, ring.get() raises IndexError once it is overwritten.
 
     Methods:
         open_connection(): Open the instrument connection and verify identity.
         set_config(): Apply configuration and prepare acquisition settings.
         set_cursors(): Configure vertical cursor positions and gated area measurement.
         measure_area(): Acquire gated area and convert polarity for PMT output.
+        wait_for_acquisition(): Run a single sequence and wait for it to complete, via SRQ or backoff polling.
         step_data_puller(new_size=50): Steps about to get sparse waveform voltage data, saves storage space.
+        block_data_puller(new_size=50): Pulls the record in one transfer and decimates it on the host.
         measure_waveform(channel=1): Download and scale the waveform voltage data and time axis parameters from the given channel.
+        query_preamble(): Query the waveform scaling and time axis parameters.
+        invalidate(): Drop the cached preamble.
+        waveform_slot(length): Reserve the next record of the waveform ring buffer.
         measure(): Run enabled measurements and optionally send the payload to Rex.
         full_autoset(): Execute the instrument autoset sequence.
         close(): Close the PyVISA resource safely.
@@ -59,6 +76,8 @@ class DPO7104_TekTronix_scope(RexSupport):
     #pyvisa settings
     RESOURCE_MANAGER = '' #default to pyvisa's default backend, but can be set to "@ivi" or other backends if needed for compatibility with specific GPIB-USB adapters or drivers. 
     SCOPE_ADDRESS = "GPIB0::1::INSTR" #may need to change for PCI-GPIB
+    POLL_MIN_INTERVAL = 0.01 #BUSY? polling backoff when service requests are unavailable, in s
+    POLL_MAX_INTERVAL = 0.5
 
     __toml_config__ = {
         "device.DPO7104_TekTronix_scope": {
@@ -70,6 +89,11 @@ class DPO7104_TekTronix_scope(RexSupport):
             "waveform": {"_value": False, "_description": "Pulls voltage wavefrom data, channel 1"},
             "trigger": {"_value": False, "_description": "Pulls trigger waveform data, channel 2"},
             "samples_saved": {"_value": 50, "_description": "Number of samples to be saved of the waveform"}, #100000 for all, ie for lifetimes. Don't do this for multiple scans.
+            "decimation": {"_value": "stride", "_description": "How the waveform is reduced to samples_saved points: stride, mean or minmax pull the record in one transfer and decimate on the host, step pulls one point per query"},
+            "transfer_width": {"_value": 2, "_description": "Bytes per sample transferred from the scope (DATa:WIDth), 1 halves the transfer time but keeps only 8 bits of the averaged waveform"},
+            "completion": {"_value": "srq", "_description": "How the end of an averaged acquisition is detected: srq waits for an *OPC service request, poll polls BUSY? with backoff"},
+            "cache_preamble": {"_value": True, "_description": "Reuse the waveform scaling and time axis parameters between acquisitions, disable if settings are changed on the front panel mid scan"},
+            "ring_buffer_records": {"_value": 2, "_description": "Number of waveforms kept in the memory-mapped ring the driver scales into. Published waveforms are views of the ring, valid until this many further waveforms have been pulled"},
         }
     }
 
@@ -93,7 +117,8 @@ class DPO7104_TekTronix_scope(RexSupport):
             "area": Measurement(data=[], unit="Vs"),  #may not be these units on display
             "waveform": Measurement(data=[], unit="V"), #may not be these units on display
             "trigger": Measurement(data=[], unit="V"), #may not be these units on display
-            "time_from_trigger_parameters": Measurement(data=[], unit="s") #unit after reconstruction, use: np.arange(0, {int(self.record_length)}, step={int(self.record_length)//voltages.size}) * {x_incr} + {x_zero} - {trigger_pos}
+            "time_from_trigger": Measurement(data=[], unit="s"), #time of every saved waveform point, decimated waveforms only
+            "time_from_trigger_parameters": Measurement(data=[], unit="s") #unit after reconstruction, use: np.arange(0, {record_length}, step={step}) * {x_incr} + {x_zero} - {trigger_pos}, each time repeated twice for minmax
         }
 
         self.validate_measurements()
@@ -129,6 +154,23 @@ class DPO7104_TekTronix_scope(RexSupport):
         self.waveform_enabled = self.require_config("waveform")
         self.trigger_enabled = self.require_config("trigger")
         self.samples_saved = self.require_config("samples_saved")
+        self.decimation = self.config.get("decimation", "stride")
+        if self.decimation not in DECIMATION_MODES + ("step",):
+            self.logger.error(f"Unknown decimation mode {self.decimation}")
+            raise ValueError(f"decimation must be one of {DECIMATION_MODES + ('step',)}, got {self.decimation}")
+        self.transfer_width = self.config.get("transfer_width", 2)
+        if self.transfer_width not in (1, 2):
+            raise ValueError(f"transfer_width must be 1 or 2, got {self.transfer_width}")
+        self.transfer_datatype = "b" if self.transfer_width == 1 else "h"
+        self.ring_buffer_records = self.config.get("ring_buffer_records", 2)
+        self.ring = None
+        self.waveform_sequence = None
+        # time axis of the decimated waveform, rebuilt only when the record or decimation changes
+        self.time_cache = (None, None, None)
+        self.preamble = PreambleCache(self.config.get("cache_preamble", True))
+        self.completion = self.config.get("completion", "srq")
+        self.completion_latency = 0.0
+        self.completion_queries = 0
 
         if not self.scope:
             raise RuntimeError("Oscilloscope connection is not open. Check the cable connections.")
@@ -153,6 +195,9 @@ class DPO7104_TekTronix_scope(RexSupport):
         #self.scope.write(f'CH1:POSition {v_position}') #turn off to allow manual adjustment
 
         self.scope.write("*CLS") #clears the event status registers, not the acquisitions
+        if self.completion == "srq":
+            self.scope.write("*ESE 1") #operation complete sets the event summary bit
+            self.scope.write("*SRE 32") #and the event summary bit raises a service request
 
     def set_cursors(self): 
         self.scope.write('CURSor:STATE ON') #this sometimes doesn't set cursors to be from channel 1, check the scope
@@ -169,21 +214,8 @@ class DPO7104_TekTronix_scope(RexSupport):
         """Waits till the scope has enough acquisitionS, from now, to make an average, then pulls the area and
         multiplies by -1"""
         if self.averages > 1:
-            self.scope.write('ACQuire:STOPAfter SEQUENCE')
-            self.scope.write('ACQuire:STATE RUN')
-            
-            # Base buffer (e.g. 5s) + expected time per average (e.g. 0.5s)
-            timeout_at = time.time() + 5.0 + (self.averages * 0.5)
-            
-            while True:
-                is_busy = int(self.scope.query("BUSY?"))
-                if not is_busy:
-                    break # Success, acquisition is completed
-                    
-                if time.time() > timeout_at:
-                    self.scope.write('ACQuire:STATE STOP')
-                    raise TimeoutError(f"Scope timed out waiting for {self.averages} averages. Check trigger!")
-        
+            self.wait_for_acquisition()
+
         self.scope.write('MEASUrement:IMMEd:STATE ON')
         area = float(self.scope.query('MEASUrement:IMMEd:VALue?'))
         a_unit = str(self.scope.query('MEASUrement:IMMEd:UNits?').strip()).strip('"')
@@ -195,6 +227,64 @@ class DPO7104_TekTronix_scope(RexSupport):
                 unit=a_unit,
             )
         
+    def wait_for_acquisition(self):
+        """Starts a single sequence and waits for it to complete. With completion = "srq" the scope raises a service
+        request through *OPC once the sequence is done, so the bus is idle while averaging. If SRQ is not supported by
+        the VISA backend or interface this falls back to polling BUSY? with exponential backoff, starting from a
+        fraction of the previous completion latency. The latency is published with the measurement and, with the
+        number of queries made, kept in completion_latency and completion_queries."""
+        # Base buffer (e.g. 5s) + expected time per average (e.g. 0.5s)
+        timeout = 5.0 + (self.averages * 0.5)
+        started = time.perf_counter()
+        self.completion_queries = 0
+
+        self.scope.write('ACQuire:STOPAfter SEQUENCE')
+        self.scope.write('ACQuire:STATE RUN')
+
+        if self.completion == "srq":
+            self.scope.write('*OPC') #sets the OPC bit of the event status register once the sequence has completed
+            try:
+                self.scope.wait_for_srq(int(timeout * 1000))
+                self.scope.query("*ESR?") #clears the event status register for the next sequence
+                self.completion_queries += 1
+                self.record_completion(started, "srq")
+                return
+            except pyvisa.errors.VisaIOError as e:
+                if e.error_code == pyvisa.constants.StatusCode.error_timeout:
+                    self.scope.write('ACQuire:STATE STOP')
+                    raise TimeoutError(f"Scope timed out waiting for {self.averages} averages. Check trigger!")
+                self.logger.warning(f"Service requests not available ({e}), falling back to polling BUSY?")
+            except (AttributeError, NotImplementedError) as e:
+                self.logger.warning(f"Service requests not supported by this resource ({e}), falling back to polling BUSY?")
+            self.completion = "poll"
+
+        timeout_at = started + timeout
+        # most of the previous acquisition time is spent idle, only then start polling
+        time.sleep(min(0.5 * self.completion_latency, timeout))
+        delay = self.POLL_MIN_INTERVAL
+        while True:
+            is_busy = int(self.scope.query("BUSY?"))
+            self.completion_queries += 1
+            if not is_busy:
+                break # Success, acquisition is completed
+
+            if time.perf_counter() > timeout_at:
+                self.scope.write('ACQuire:STATE STOP')
+                raise TimeoutError(f"Scope timed out waiting for {self.averages} averages. Check trigger!")
+            time.sleep(delay)
+            delay = min(delay * 2, self.POLL_MAX_INTERVAL)
+
+        self.record_completion(started, "poll")
+
+    def record_completion(self, started, mechanism):
+        """Stores the latency of the acquisition that started at perf_counter() time started and adds it to the measurements."""
+        self.completion_latency = time.perf_counter() - started
+        self.measurements["completion_latency"] = Measurement(
+                data=[self.completion_latency],
+                unit="s",
+            )
+        self.logger.debug(f"Acquisition of {self.averages} averages completed after {self.completion_latency:.3f}s via {mechanism}, {self.completion_queries} queries")
+
     def step_data_puller(self, new_size=50):
         """Pulls one point of the waveform data, then steps further and pulls again, to try to avoid overwhelming the scope's 
         CPU and saving massive data files. This is a bit of a hack, but you cannot change the scope's sampling rate (and thus 
@@ -209,90 +299,143 @@ class DPO7104_TekTronix_scope(RexSupport):
             stop = min(start, total_points) #pulls 1 point every step
             self.scope.write(f"DATa:STARt {start}")
             self.scope.write(f"DATa:STOP {stop}")
-            adc_samples[start//step_size] = (self.scope.query_binary_values("CURVe?", datatype='h', is_big_endian=True, container=np.ndarray))[0]
+            adc_samples[start//step_size] = (self.scope.query_binary_values("CURVe?", datatype=self.transfer_datatype, is_big_endian=True, container=np.ndarray))[0]
             pull_log += 1
 
         self.logger.debug(f'Made: {pull_log} CURve? pulls')
-        return np.array(adc_samples)
+        return adc_samples
+
+    def block_data_puller(self, new_size=50):
+        """Pulls the record in a single CURVe? block transfer and decimates it on the host, so the capture time
+        is constant rather than growing with new_size. Only the bins kept are transferred, which is still close to the
+        full record, as the scope cannot skip samples. Returns new_size points, or 2*new_size for the minmax envelope.
+        new_size is capped at the record length."""
+        new_size = min(new_size, self.record_length)
+        self.scope.write("DATa:STARt 1")
+        self.scope.write(f"DATa:STOP {(self.record_length // new_size) * new_size}")
+        adc_samples = self.scope.query_binary_values("CURVe?", datatype=self.transfer_datatype, is_big_endian=True, container=np.ndarray)
+        self.logger.debug(f'Made 1 CURve? pull of {adc_samples.size} points, {self.decimation} decimated to {new_size} bins')
+        return decimate(adc_samples, new_size, self.decimation)
     
     def measure_waveform(self, channel=1):
         """Slowly pulls the waveform data and the parameters to reconstruct the time axis. Channel 2 for trigger for debugging.
         This will save a lot of data and the scope's cpu can struggle to keep up, so use with caution and only use if required"""
         if self.averages > 1 and not self.area_enabled: #wait till fully averaged
-            self.scope.write('ACQuire:STOPAfter SEQUENCE')
-            self.scope.write('ACQuire:STATE RUN')
-             # Base buffer (e.g. 5s) + expected time per average (e.g. 0.5s)
-            timeout_at = time.time() + 5.0 + (self.averages * 0.5)
-            
-            while True:
-                is_busy = int(self.scope.query("BUSY?"))
-                if not is_busy:
-                    break # Success, acquisition is completed
-                    
-                if time.time() > timeout_at:
-                    self.scope.write('ACQuire:STATE STOP')
-                    raise TimeoutError(f"Scope timed out waiting for {self.averages} averages. Check trigger!")
+            self.wait_for_acquisition()
 
         self.scope.write(f"DATa:SOUrce CH{channel}")
         self.scope.write("DATa:ENCdg RIBINARY")
-        self.scope.write("DATa:WIDth 2") 
+        self.scope.write(f"DATa:WIDth {self.transfer_width}")
 
-        self.record_length = int(self.scope.query("HORizontal:RECOrdlength?").strip())
+        self.record_length = self.preamble.get("record_length", lambda: int(self.scope.query("HORizontal:RECOrdlength?").strip()))
 
-        if self.samples_saved > 90000:
+        if self.samples_saved > 90000 or self.samples_saved >= self.record_length:
             self.scope.write("DATa:STARt 1")
             self.scope.write(f"DATa:STOP {self.record_length}") #save all 100000 data points, will take ~4s, there is probably a better method
             self.scope.write("ACQuire:STOPAfter SEQuence") #stops the scope to pull, may need to put inside step_data_puller
-            adc_samples = np.array(self.scope.query_binary_values("CURVe?", datatype='h', is_big_endian=True))
+            adc_samples = self.scope.query_binary_values("CURVe?", datatype=self.transfer_datatype, is_big_endian=True, container=np.ndarray)
             self.scope.write("ACQuire:STOPAfter RUNSTOP")
             self.scope.write("ACQuire:STATE RUN")
 
         else:
             self.scope.write("ACQuire:STOPAfter SEQuence")
-            adc_samples = self.step_data_puller(new_size=self.samples_saved)
+            if self.decimation == "step":
+                adc_samples = self.step_data_puller(new_size=self.samples_saved)
+            else:
+                adc_samples = self.block_data_puller(new_size=self.samples_saved)
             self.scope.write("ACQuire:STOPAfter RUNSTOP")
             self.scope.write("ACQuire:STATE RUN")
 
-        # Query scaling parameters from the preamble
-        y_mult = float(self.scope.query("WFMOutpre:YMUlt?"))
-        y_off  = float(self.scope.query("WFMOutpre:YOFf?"))
-        y_zero = float(self.scope.query("WFMOutpre:YZEro?"))
-
-        x_incr = float(self.scope.query("WFMOutpre:XINcr?"))
-        x_zero = float(self.scope.query("WFMOutpre:XZEro?"))
-        trigger_pos = float(self.scope.query("HORizontal:MAIn:SCAle?"))
-
-        self.logger.debug(f"Waveform scaling parameters: y_mult={y_mult}, y_off={y_off}, y_zero={y_zero}, x_incr={x_incr}, x_zero={x_zero}, trigger_pos={trigger_pos}")
-
-        voltages = (adc_samples - y_off) * y_mult + y_zero
+        # Scaling parameters from the preamble, only queried when the cache has been invalidated
+        preamble = self.preamble.get(channel, self.query_preamble)
+        y_mult, y_off, y_zero = preamble["y_mult"], preamble["y_off"], preamble["y_zero"]
+        x_incr, x_zero, trigger_pos = preamble["x_incr"], preamble["x_zero"], preamble["trigger_pos"]
+        y_unit, x_unit = preamble["y_unit"], preamble["x_unit"]
+
+        # scale in place into the ring buffer rather than allocating new arrays per acquisition
+        voltages = self.waveform_slot(adc_samples.size)
+        np.subtract(adc_samples, y_off, out=voltages)
+        voltages *= y_mult
+        voltages += y_zero
+        self.waveform_sequence = self.ring.commit(voltages.size)
         #time_axis = np.arange(adc_samples.size) * x_incr + x_zero - trigger_pos #relative to trigger
 
-        data = voltages.tolist()
         #times = time_axis.tolist()
-        y_unit = str(self.scope.query("WFMOutpre:YUnit?").strip()).strip('"') #to check mV or V
-        x_unit = str(self.scope.query("WFMOutpre:XUnit?").strip()).strip('"')
 
-        time_params = [int(self.record_length), int(self.record_length)//voltages.size, x_incr, x_zero, trigger_pos]
-        #times = np.arange(0, {int(self.record_length)}, step={int(self.record_length)//voltages.size}) * {x_incr} + {x_zero} - {trigger_pos}
+        # where the saved points lie in the record: the first sample of each bin for stride and step, the bin centre
+        # for mean and minmax, with both minmax points of a bin sharing its centre
+        # the full record is described by the time axis parameters alone, only decimated captures publish their times
+        if adc_samples.size == self.record_length:
+            step, first = 1, 0.0
+            self.measurements.pop("time_from_trigger", None)
+        else:
+            mode = "stride" if self.decimation == "step" else self.decimation
+            key = (int(self.record_length), self.samples_saved, mode, x_incr, x_zero, trigger_pos)
+            cached_key, first, times = self.time_cache
+            if cached_key != key:
+                positions = decimated_positions(int(self.record_length), self.samples_saved, mode)
+                first = positions[0]
+                times = (positions * x_incr + (x_zero - trigger_pos)).reshape(1, -1)
+                times.flags.writeable = False
+                self.time_cache = (key, first, times)
+            step = int(self.record_length) // self.samples_saved
+            self.measurements["time_from_trigger"] = ArrayMeasurement(
+                data=times,
+                unit=x_unit,
+            )
+
+        time_params = [int(self.record_length), step, x_incr, x_zero + first * x_incr, trigger_pos]
+        #times = np.arange(0, {record_length}, step={step}) * {x_incr} + {x_zero} - {trigger_pos}, np.repeat(times, 2) for minmax
         
         self.measurements["time_from_trigger_parameters"] = Measurement(
                 data=[time_params],
                 unit=x_unit, #need to reconstruct, but will then be in s
             )
 
+        # zero-copy views of the ring, publish_measurements records and encodes them before the slot is reused
         if channel == 1:
-            self.measurements["waveform"] = Measurement(
-                data=[data],
+            self.measurements["waveform"] = ArrayMeasurement(
+                data=voltages.reshape(1, -1),
                 unit=y_unit,
             )
         elif channel == 2:
-            self.measurements["trigger"] = Measurement(
-                data=[data],
+            self.measurements["trigger"] = ArrayMeasurement(
+                data=voltages.reshape(1, -1),
                 unit=y_unit,
             )
         else:
             raise Exception('Only channel 1 and 2 supported for data saving, but this could easily be modified')
         
+    def query_preamble(self):
+        """Queries the scaling and time axis parameters of the waveform selected by DATa:SOUrce."""
+        preamble = {
+            "y_mult": float(self.scope.query("WFMOutpre:YMUlt?")),
+            "y_off": float(self.scope.query("WFMOutpre:YOFf?")),
+            "y_zero": float(self.scope.query("WFMOutpre:YZEro?")),
+            "x_incr": float(self.scope.query("WFMOutpre:XINcr?")),
+            "x_zero": float(self.scope.query("WFMOutpre:XZEro?")),
+            "trigger_pos": float(self.scope.query("HORizontal:MAIn:SCAle?")),
+            "y_unit": str(self.scope.query("WFMOutpre:YUnit?").strip()).strip('"'), #to check mV or V
+            "x_unit": str(self.scope.query("WFMOutpre:XUnit?").strip()).strip('"'),
+        }
+        self.logger.debug(f"Waveform scaling parameters: {preamble}")
+        return preamble
+
+    def invalidate(self):
+        """Drops the cached preamble so it is queried again on the next waveform pull. Call this after changing
+        the vertical or horizontal settings on the front panel."""
+        self.preamble.invalidate()
+
+    def waveform_slot(self, length):
+        """Returns a writable view of the next ring buffer record, (re)allocating the ring if the record does not fit.
+        The ring is sized by the decimated waveform rather than the record length. Published waveforms are views of
+        it, valid until ring_buffer_records further waveforms have been pulled; copy them to keep them longer."""
+        if self.ring is None or not self.ring.fits(length):
+            # both channels of a measure() must still be held when it publishes them
+            capacity = max(self.ring_buffer_records, self.waveform_enabled + self.trigger_enabled)
+            self.ring = WaveformRingBuffer(capacity, length)
+        return self.ring.reserve(length)
+
     def measure(self):
         self.scope.write("*CLS") #clears the event status registers, not the acquisitions
 
@@ -305,16 +448,16 @@ class DPO7104_TekTronix_scope(RexSupport):
 
         self.state += 1
 
-        if self.connect_to_rex:
-            payload = self.create_payload()
-            self.tcp_send(payload, self.sock)
+        self.publish_measurements()
 
         return self.measurements
     
     def full_autoset(self):
         self.scope.write("AUToset EXECute")
+        self.invalidate()
         
     def close(self):
+        self.flush_rex()
         if self.scope:
             self.scope.close()
 
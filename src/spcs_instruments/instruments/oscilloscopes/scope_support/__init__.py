@@ -0,0 +1,23 @@
+from .decimation import DECIMATION_MODES, decimate, decimated_positions
+from .preamble import PreambleCache
+from .ring_buffer import WaveformRingBuffer
+from .siglent_decode import (
+    decode_siglent_waveform,
+    parse_siglent_header,
+    siglent_time_parameters,
+    siglent_waveform_setup,
+    time_axis,
+)
+
+__all__ = [
+    "DECIMATION_MODES",
+    "PreambleCache",
+    "WaveformRingBuffer",
+    "decimate",
+    "decimated_positions",
+    "decode_siglent_waveform",
+    "parse_siglent_header",
+    "siglent_time_parameters",
+    "siglent_waveform_setup",
+    "time_axis",
+]
@@ -0,0 +1,71 @@
+import numpy as np
+
+DECIMATION_MODES = ("stride", "mean", "minmax")
+
+
+def decimate(samples: np.ndarray, size: int, mode: str = "stride") -> np.ndarray:
+    """
+    Reduces a full waveform record to `size` points on the host.
+
+    The record is split into `size` equal bins of `len(samples) // size` samples, any remainder
+    at the end of the record is dropped.
+
+    Args:
+        samples (np.ndarray): The full record.
+        size (int): Number of bins.
+        mode (str, optional): How each bin is reduced. 'stride' keeps the first sample of every bin,
+            which is what stepping DATa:STARt across the record returns. 'mean' averages the bin and
+            'minmax' keeps its minimum and maximum, interleaved, giving an envelope of 2 * size points.
+            Defaults to 'stride'.
+
+    Returns:
+        np.ndarray: The decimated record.
+    """
+    step = len(samples) // size
+    if step < 1:
+        raise ValueError(
+            f"Cannot decimate a record of {len(samples)} samples to {size} points"
+        )
+    if mode == "stride":
+        return samples[: step * size : step]
+    bins = samples[: step * size].reshape(size, step)
+    if mode == "mean":
+        return bins.mean(axis=1)
+    if mode == "minmax":
+        envelope = np.empty((size, 2), dtype=samples.dtype)
+        np.min(bins, axis=1, out=envelope[:, 0])
+        np.max(bins, axis=1, out=envelope[:, 1])
+        return envelope.reshape(-1)
+    raise ValueError(
+        f"Unknown decimation mode {mode!r}, options: {', '.join(DECIMATION_MODES)}"
+    )
+
+
+def decimated_positions(record_length: int, size: int, mode: str = "stride") -> np.ndarray:
+    """
+    Returns where in the record each point returned by decimate lies, as (fractional) sample indices.
+
+    Strided points are the first sample of their bin, mean points the centre of their bin and
+    both minmax points of a bin are placed at its centre, as the positions of the extremes are
+    not kept.
+
+    Args:
+        record_length (int): Number of samples in the full record.
+        size (int): Number of bins, as passed to decimate.
+        mode (str, optional): Decimation mode, one of DECIMATION_MODES. Defaults to 'stride'.
+
+    Returns:
+        np.ndarray: Sample index of every decimated point, 2 * size of them for minmax.
+    """
+    step = record_length // size
+    positions = np.arange(size, dtype=np.float64) * step
+    if mode == "stride":
+        return positions
+    positions += (step - 1) / 2
+    if mode == "mean":
+        return positions
+    if mode == "minmax":
+        return np.repeat(positions, 2)
+    raise ValueError(
+        f"Unknown decimation mode {mode!r}, options: {', '.join(DECIMATION_MODES)}"
+    )
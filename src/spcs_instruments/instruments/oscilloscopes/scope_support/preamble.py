@@ -0,0 +1,53 @@
+class PreambleCache:
+    """
+    Caches waveform preamble (scaling and time axis) parameters between acquisitions.
+
+    The preamble of a channel almost never changes during a scan, so it is queried once and reused
+    until the driver changes a setting that affects it, or the cache is invalidated explicitly,
+    e.g. after settings have been changed on the front panel.
+
+    Attributes:
+        enabled (bool): Whether entries are reused. When False every lookup queries the scope.
+        hits (int): Number of lookups served from the cache.
+        misses (int): Number of lookups that queried the scope.
+    """
+
+    def __init__(self, enabled: bool = True):
+        """
+        Args:
+            enabled (bool, optional): Whether entries are reused. Defaults to True.
+        """
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+
+    def get(self, key, fetch):
+        """
+        Returns the preamble stored under key, calling fetch to query it from the scope if needed.
+
+        Args:
+            key: Cache key, typically the channel.
+            fetch (callable): Queries the preamble from the scope.
+
+        Returns:
+            The preamble, as returned by fetch.
+        """
+        if self.enabled and key in self._entries:
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        preamble = self._entries[key] = fetch()
+        return preamble
+
+    def invalidate(self, key=None) -> None:
+        """
+        Drops cached preambles.
+
+        Args:
+            key (optional): Only drop the preamble stored under key. Drops everything if None.
+        """
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
@@ -0,0 +1,106 @@
+import tempfile
+import time
+
+import numpy as np
+
+
+class WaveformRingBuffer:
+    """
+    Preallocated, memory-mapped ring of fixed-size waveform records.
+
+    Scope drivers write waveforms straight into the next slot instead of allocating fresh
+    arrays for every acquisition, so memory stays flat over multi-hour scans. Consumers such as
+    savers and Rex senders read zero-copy views of committed records. A view is only valid until
+    the ring wraps around, i.e. for the next `capacity` records.
+
+    Attributes:
+        capacity (int): Number of records held before the oldest is overwritten.
+        record_length (int): Maximum number of samples per record.
+        dtype (np.dtype): Sample data type.
+        sequence (int): Number of records committed so far.
+    """
+
+    def __init__(
+        self, capacity: int, record_length: int, dtype=np.float64, path: str = None
+    ):
+        """
+        Args:
+            capacity (int): Number of records held before the oldest is overwritten.
+            record_length (int): Maximum number of samples per record.
+            dtype (np.dtype, optional): Sample data type. Defaults to float64.
+            path (str, optional): File backing the ring. An anonymous temporary file is used if None.
+        """
+        self.capacity = max(1, int(capacity))
+        self.record_length = int(record_length)
+        self.dtype = np.dtype(dtype)
+        self._file = path if path is not None else tempfile.TemporaryFile()
+        self.records = np.memmap(
+            self._file,
+            dtype=self.dtype,
+            mode="w+",
+            shape=(self.capacity, self.record_length),
+        )
+        self.lengths = np.zeros(self.capacity, dtype=np.int64)
+        self.timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self.sequence = 0
+
+    def __len__(self) -> int:
+        return min(self.sequence, self.capacity)
+
+    def reserve(self, length: int) -> np.ndarray:
+        """
+        Returns a writable view of the next slot, to be filled in place and then committed.
+
+        Args:
+            length (int): Number of samples that will be written.
+
+        Returns:
+            np.ndarray: View of the first `length` samples of the next slot.
+        """
+        if length > self.record_length:
+            raise ValueError(
+                f"Record of {length} samples does not fit the ring's record length of {self.record_length}"
+            )
+        return self.records[self.sequence % self.capacity, :length]
+
+    def commit(self, length: int) -> int:
+        """
+        Marks the reserved slot as holding a complete record.
+
+        Args:
+            length (int): Number of samples written into the slot.
+
+        Returns:
+            int: Sequence number of the committed record.
+        """
+        slot = self.sequence % self.capacity
+        self.lengths[slot] = length
+        self.timestamps[slot] = time.time()
+        self.sequence += 1
+        return self.sequence - 1
+
+    def get(self, sequence: int) -> np.ndarray:
+        """
+        Returns a zero-copy view of a committed record.
+
+        Args:
+            sequence (int): Sequence number returned by commit.
+
+        Returns:
+            np.ndarray: View of the record.
+
+        Raises:
+            IndexError: If the record has not been committed yet or has been overwritten.
+        """
+        if not self.sequence - len(self) <= sequence < self.sequence:
+            raise IndexError(f"Record {sequence} is not held in the ring")
+        slot = sequence % self.capacity
+        return self.records[slot, : self.lengths[slot]]
+
+    def latest(self) -> np.ndarray:
+        """Returns a zero-copy view of the most recently committed record."""
+        return self.get(self.sequence - 1)
+
+    def fits(self, length: int) -> bool:
+        """Whether a record of `length` samples fits in a slot."""
+        return length <= self.record_length
@@ -0,0 +1,150 @@
+import numpy as np
+
+# the SDS2000X-E screen is 14 horizontal divisions wide and 25 codes per vertical division
+SIGLENT_HORIZONTAL_DIVISIONS = 14
+SIGLENT_CODES_PER_DIVISION = 25
+
+
+def parse_siglent_header(raw: bytes) -> tuple:
+    """
+    Locates the samples of a raw `wf? dat2` response.
+
+    The response is a prefix such as `DAT2,` or `C1:WF DAT2,`, depending on the chdr setting,
+    followed by an IEEE 488.2 definite length block `#<n><n digit byte count><bytes>` and the
+    terminating newlines.
+
+    Args:
+        raw (bytes): Response returned by read_raw.
+
+    Returns:
+        tuple: (offset of the first sample, number of samples)
+    """
+    start = raw.find(b"#")
+    if start < 0 or start + 2 > len(raw) or not raw[start + 1 : start + 2].isdigit():
+        raise ValueError(f"No block header in waveform response {raw[:32]!r}")
+    digits = int(raw[start + 1 : start + 2])
+    offset = start + 2 + digits
+    count = int(raw[start + 2 : offset])
+    if offset + count > len(raw):
+        raise ValueError(
+            f"Waveform response truncated, header announces {count} bytes but {len(raw) - offset} were read"
+        )
+    return offset, count
+
+
+def decode_siglent_waveform(
+    raw: bytes, vdiv: float, ofst: float, out: np.ndarray = None
+) -> np.ndarray:
+    """
+    Converts a raw `wf? dat2` response into voltages.
+
+    The samples are read as signed bytes straight from the response buffer, which is the
+    two's complement fix-up of the programming manual (page 142), and scaled in place.
+
+    Args:
+        raw (bytes): Response returned by read_raw, including header and trailer, see parse_siglent_header.
+        vdiv (float): Volts per division of the channel.
+        ofst (float): Vertical offset of the channel in volts.
+        out (np.ndarray, optional): Float array to write the voltages into. Allocated if None.
+
+    Returns:
+        np.ndarray: The voltages.
+    """
+    offset, count = parse_siglent_header(raw)
+    codes = np.frombuffer(raw, dtype=np.int8, count=count, offset=offset)
+    if out is None:
+        out = np.empty(count, dtype=np.float64)
+    np.divide(codes, SIGLENT_CODES_PER_DIVISION, out=out)
+    out *= vdiv
+    out -= ofst
+    return out
+
+
+def siglent_time_parameters(
+    samples: int,
+    tdiv: float,
+    sara: float,
+    horizontal_offset: float,
+    first_point: int = 0,
+    sparsing: int = 1,
+) -> dict:
+    """
+    Describes the time axis of a waveform without materialising it.
+
+    The time of sample i is `t0 + i * dt`.
+
+    Args:
+        samples (int): Number of samples in the waveform.
+        tdiv (float): Seconds per horizontal division.
+        sara (float): Sample rate in samples per second.
+        horizontal_offset (float): Time of the reference cursor in seconds.
+        first_point (int, optional): Index in the full record of the first sample transferred. Defaults to 0.
+        sparsing (int, optional): Interval in the full record between transferred samples. Defaults to 1.
+
+    Returns:
+        dict: Start time `t0`, sample interval `dt` and number of `samples`.
+    """
+    return {
+        "t0": -(tdiv * SIGLENT_HORIZONTAL_DIVISIONS / 2)
+        - horizontal_offset
+        + first_point / sara,
+        "dt": sparsing / sara,
+        "samples": samples,
+    }
+
+
+def siglent_waveform_setup(
+    start: float,
+    stop: float,
+    tdiv: float,
+    sara: float,
+    horizontal_offset: float,
+    sparsing: int = 1,
+    max_points: int = 0,
+) -> dict:
+    """
+    Works out the WAVEFORM_SETUP transferring the samples between two times.
+
+    Args:
+        start (float): Time of the first sample wanted, on the time axis of siglent_time_parameters. None for the start of the record.
+        stop (float): Time of the last sample wanted. None for the end of the record.
+        tdiv (float): Seconds per horizontal division.
+        sara (float): Sample rate in samples per second.
+        horizontal_offset (float): Time of the reference cursor in seconds.
+        sparsing (int, optional): Minimum interval between transferred samples. Defaults to 1.
+        max_points (int, optional): Maximum number of samples transferred, raising the sparsing as needed. 0 for no limit.
+
+    Returns:
+        dict: `sparsing`, number of `points` and `first_point`, clipped to the record.
+    """
+    t0 = -(tdiv * SIGLENT_HORIZONTAL_DIVISIONS / 2) - horizontal_offset
+    record = int(round(tdiv * SIGLENT_HORIZONTAL_DIVISIONS * sara))
+    first_point = 0 if start is None else int(np.floor((start - t0) * sara))
+    first_point = min(max(first_point, 0), record - 1)
+    last_point = record - 1 if stop is None else int(np.ceil((stop - t0) * sara))
+    last_point = min(max(last_point, first_point), record - 1)
+    window = last_point - first_point + 1
+    sparsing = max(int(sparsing), 1)
+    if max_points:
+        sparsing = max(sparsing, -(-window // max_points))
+    return {
+        "sparsing": sparsing,
+        "points": -(-window // sparsing),
+        "first_point": first_point,
+    }
+
+
+def time_axis(time_parameters: dict) -> np.ndarray:
+    """
+    Materialises the time axis described by siglent_time_parameters.
+
+    Args:
+        time_parameters (dict): Output of siglent_time_parameters.
+
+    Returns:
+        np.ndarray: Time of every sample in seconds.
+    """
+    axis = np.arange(time_parameters["samples"], dtype=np.float64)
+    axis *= time_parameters["dt"]
+    axis += time_parameters["t0"]
+    return axis
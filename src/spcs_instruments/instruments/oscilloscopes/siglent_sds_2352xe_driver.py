@@ -1,11 +1,24 @@
+import re
 import time
 
 import numpy as np
 import pyvisa
-from rex_utils import DeviceError, Measurement, RexSupport
-
-
-class SiglentSDS2352XE(RexSupport):
+from rex_utils import DeviceError, Measurement
+
+from ...rex_support import SpcsRexSupport
+from ..visa_support import find_resource
+from .scope_support import (
+    PreambleCache,
+    WaveformRingBuffer,
+    decode_siglent_waveform,
+    parse_siglent_header,
+    siglent_time_parameters,
+    siglent_waveform_setup,
+    time_axis,
+)
+
+
+class SiglentSDS2352XE(SpcsRexSupport):
     """
     Class to create user-fiendly interface with the SiglentSDS2352X-E scope.
     note! cursors must be on for this method to work!
@@ -34,11 +47,60 @@ class SiglentSDS2352XE(RexSupport):
             "channel": {"_value": "c1", "_description": "Desired measurement channel"},
             "data_type": {
                 "_value": "area",
-                "_description": "Return the area, or the full trace. Options: area, trace",
+                "_description": "Return the area computed from the downloaded waveform, the area (or another parameter) measured on the scope, or the full trace. Options: area, scope_area, trace",
+            },
+            "scope_parameter": {
+                "_value": "AREA",
+                "_description": "Parameter measured on the scope in scope_area mode, gated as set up on the scope. Options: AREA, MEAN",
+            },
+            "verify_every": {
+                "_value": 0,
+                "_description": "In scope_area mode, also download the waveform every n-th point and compare the host computed parameter against the scope's. 0 disables",
+            },
+            "verify_tolerance": {
+                "_value": 0.05,
+                "_description": "Relative difference between the scope and host values above which verification logs a warning",
+            },
+            "adaptive_wait": {
+                "_value": True,
+                "_description": "Wait for the averages by polling the scope for new acquisitions and calibrating to the measured trigger rate, instead of sleeping averages / frequency",
+            },
+            "trigger_timeout": {
+                "_value": 5.0,
+                "_description": "Time in seconds without a new acquisition after which the adaptive wait gives up",
+            },
+            "cache_preamble": {
+                "_value": True,
+                "_description": "Reuse the channel scale, offset, timebase, sample rate and cursor position between acquisitions. Disable if they are changed on the front panel mid scan",
+            },
+            "window": {
+                "_value": [],
+                "_description": "Start and stop time in seconds, relative to the x1 cursor, of the part of the record transferred. Empty transfers the whole record",
+            },
+            "sparsing": {
+                "_value": 1,
+                "_description": "Transfer only every n-th sample of the record (or window)",
+            },
+            "max_points": {
+                "_value": 0,
+                "_description": "Maximum number of samples transferred per waveform, raising the sparsing as needed. 0 for no limit",
+            },
+            "ring_buffer_records": {
+                "_value": 2,
+                "_description": "Number of transferred records (after window and sparsing) kept in the memory-mapped ring the driver decodes into. Waveforms returned are views of the ring, valid until this many further waveforms have been read",
             },
         }
     }
 
+    # INR? bit set when a new acquisition has completed, and the polling backoff bounds in s
+    INR_NEW_ACQUISITION = 0x01
+    POLL_MIN_INTERVAL = 0.005
+    POLL_MAX_INTERVAL = 0.5
+    # parameters readable with PAVA? in scope_area mode, and their units
+    SCOPE_PARAMETERS = {"AREA": "Vs", "MEAN": "V"}
+    # leading number of a PAVA? value such as 1.23E-06V.s
+    _NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
     def __init__(self, config, name="SIGLENT_Scope", connect_to_rex=True):
         """
         Initializes the SDS2352X-E with a given configuration.
@@ -53,28 +115,16 @@ class SiglentSDS2352XE(RexSupport):
         super().__init__(name=name)
         self.bind_config(config)
         self.resource_adress = "not found"
-        resources = rm.list_resources()
-        for i in range(len(resources)):
-            try:
-                my_instrument = rm.open_resource(resources[i])
-                query = my_instrument.query("*IDN?").strip()
-
-                if (
-                    query
-                    == "Siglent Technologies,SDS2352X-E,SDS2EDDQ6R0793,2.1.1.1.20 R3"
-                ):
-                    self.resource_adress = resources[i]
-                    self.instrument = my_instrument
-
-            except:
-                pass
+        self.instrument = find_resource(
+            rm, "Siglent Technologies,SDS2352X-E,SDS2EDDQ6R0793,2.1.1.1.20 R3"
+        )
+        if self.instrument is not None:
+            self.resource_adress = self.instrument.resource_name
         if self.resource_adress == "not found":
             self.logger.error(
                 "Siglent Technologies,SDS2352X-E not found, try reconecting. If issues persist, restart python"
             )
 
-        self.config = self.bind_config(config)
-
         self.logger.debug(f"SIGLENT_Scope connected with this config {self.config}")
         if self.connect_to_rex:
             self.sock = self.tcp_connect()
@@ -92,7 +142,39 @@ class SiglentSDS2352XE(RexSupport):
         self.data_type = self.require_config("data_type")
         self.reset_per = self.require_config("reset_per")
         self.frequency = self.require_config("frequency")
+        self.adaptive_wait = self.config.get("adaptive_wait", True)
+        self.trigger_timeout = self.config.get("trigger_timeout", 5.0)
+        # measured by the adaptive wait, None until it has seen a few acquisitions
+        self.trigger_rate = None
+        self.fast_trigger_warned = False
         self.channel = self.require_config("channel")
+        self.ring_buffer_records = self.config.get("ring_buffer_records", 2)
+        self.ring = None
+        # sequence number of the last waveform in the ring, and the time axis last materialised
+        self.waveform_sequence = None
+        self.time_cache = (None, None)
+        self.window = self.config.get("window", []) or [None, None]
+        if len(self.window) != 2:
+            raise DeviceError(
+                f"window must be [start, stop] in seconds, got {self.window}"
+            )
+        self.sparsing = self.config.get("sparsing", 1)
+        self.max_points = self.config.get("max_points", 0)
+        # WAVEFORM_SETUP last written to the scope, rewritten whenever the window works out differently
+        self.waveform_setup = None
+        self.preamble = PreambleCache(self.config.get("cache_preamble", True))
+        self.scope_parameter = self.config.get("scope_parameter", "AREA").upper()
+        if self.scope_parameter not in self.SCOPE_PARAMETERS:
+            raise DeviceError(
+                f"scope_parameter must be one of {list(self.SCOPE_PARAMETERS)}, got {self.scope_parameter}"
+            )
+        self.verify_every = self.config.get("verify_every", 0)
+        self.verify_tolerance = self.config.get("verify_tolerance", 0.05)
+        self.points_measured = 0
+        # (scope value, host value, relative difference) of every verified point
+        self.verifications = []
+        # bare values in replies, e.g. 8193 rather than 'INR 8193'
+        self.instrument.write("chdr off")
         if self.acquisition_mode is not None and self.averages is not None:
             self.instrument.write(
                 f"ACQUIRE_WAY {self.acquisition_mode},{self.averages}"
@@ -105,7 +187,8 @@ class SiglentSDS2352XE(RexSupport):
         match self.data_type:
             case "area":
                 return self.measure_sample()
-
+            case "scope_area":
+                return self.measure_scope_parameter()
             case "trace":
                 return self.measure_trace()
             case _:
@@ -113,26 +196,123 @@ class SiglentSDS2352XE(RexSupport):
 
     def close(self):
         """
-        Releases the device.
+        Releases the device, after sending anything still queued for rex.
         """
+        self.flush_rex()
         self.instrument.close()
 
-    def get_waveform(self, channel="c1"):
+    def get_waveform(self, channel="c1", materialise_time=True):
         """
         Mostly vendor provided function to return the waveform from the oscilisope.
+
+        Only the window and sparsing configured are transferred, see program_waveform_setup. The voltages
+        returned are a zero-copy view of the waveform ring buffer and are overwritten once ring_buffer_records
+        further waveforms have been read. `self.ring.get(self.waveform_sequence)` raises IndexError once that has
+        happened, copy the voltages to keep them longer. The time axis is only rebuilt when it changes and must
+        not be modified.
+
+        Args:
+            channel (str, optional): Channel to read. Defaults to 'c1'.
+            materialise_time (bool, optional): Whether to return the full time axis, or only the parameters
+                `t0`, `dt` and `samples` describing it (see scope_support.time_axis). Defaults to True.
+
+        Returns:
+            tuple: (time: NDarray f64 or dict, voltage: NDarray f64)
+        """
+        time_parameters, voltages = self._read_waveform(channel)
+        if not materialise_time:
+            return time_parameters, voltages
+        cached_parameters, axis = self.time_cache
+        if cached_parameters != time_parameters:
+            axis = time_axis(time_parameters)
+            axis.flags.writeable = False
+            self.time_cache = (time_parameters, axis)
+        return axis, voltages
+
+    def _read_waveform(self, channel: str) -> tuple:
+        """Reads a waveform, decoded with numpy straight into the ring buffer. The voltages are a view of the ring, valid until it wraps, and their sequence number is stored in waveform_sequence."""
+        preamble = self.preamble.get(channel, lambda: self.query_preamble(channel))
+        vdiv, ofst = preamble["vdiv"], preamble["ofst"]
+        tdiv, sara = preamble["tdiv"], preamble["sara"]
+        horizontal_offset = preamble["horizontal_offset"]
+        setup = self.program_waveform_setup(preamble)
+
+        # Query the waveform of channel 1 from the scope to the controller. This write command
+        # and the next read command act like a single query command. We are telling the scope
+        # to get the waveform data ready, then reading the raw data into 'recv'
+        self.instrument.write(channel + ":wf? dat2")
+
+        recv = self.instrument.read_raw()
+        _, samples = parse_siglent_header(recv)
+
+        voltages = decode_siglent_waveform(
+            recv, vdiv, ofst, out=self.waveform_slot(samples)
+        )
+        self.waveform_sequence = self.ring.commit(voltages.size)
+
+        time_parameters = siglent_time_parameters(
+            samples,
+            tdiv,
+            sara,
+            horizontal_offset,
+            first_point=setup["first_point"],
+            sparsing=setup["sparsing"],
+        )
+        return time_parameters, voltages
+
+    def program_waveform_setup(self, preamble: dict) -> dict:
+        """
+        Sets which samples of the record the next `wf? dat2` transfers, from the configured window, sparsing
+        and max_points. The setup is only written when it changes, so the transfer size follows the points
+        requested rather than the memory depth.
+
+        Args:
+            preamble (dict): Channel preamble, as returned by query_preamble.
+
+        Returns:
+            dict: The `sparsing`, number of `points` and `first_point` in effect.
+        """
+        start, stop = self.window
+        setup = siglent_waveform_setup(
+            start,
+            stop,
+            preamble["tdiv"],
+            preamble["sara"],
+            preamble["horizontal_offset"],
+            sparsing=self.sparsing,
+            max_points=self.max_points,
+        )
+        if setup != self.waveform_setup:
+            # NP,0 transfers up to the end of the record, whatever its exact length
+            points = setup["points"] if stop is not None else 0
+            self.instrument.write(
+                f"WAVEFORM_SETUP SP,{setup['sparsing']},NP,{points},FP,{setup['first_point']}"
+            )
+            self.waveform_setup = setup
+        return setup
+
+    def query_preamble(self, channel="c1") -> dict:
+        """
+        Queries the scaling and time axis parameters of a channel.
+
+        Args:
+            channel (str, optional): Channel to query. Defaults to 'c1'.
+
+        Returns:
+            dict: vdiv, ofst, tdiv, sara and horizontal_offset, as floats in SI units.
         """
         # Change the way the scope responds to queries. For example, 'chdir off'
         # Will result in a returned value like 200E-3, instead of 'C1:VOLT_DIV 200E-3 V'
         self.instrument.write("chdr off")
 
         # Query the volts/division for channel 1
-        vdiv = self.instrument.query(f"{channel}:vdiv?")
+        vdiv = float(self.instrument.query(f"{channel}:vdiv?"))
 
         # Query the vertical offset for channel 1
-        ofst = self.instrument.query(f"{channel}:ofst?")
+        ofst = float(self.instrument.query(f"{channel}:ofst?"))
 
         # Query the time/division
-        tdiv = self.instrument.query("tdiv?")
+        tdiv = float(self.instrument.query("tdiv?"))
 
         # Query the sample rate of the scope
         sara = self.instrument.query("sara?")
@@ -149,37 +329,124 @@ class SiglentSDS2352XE(RexSupport):
 
         horizontal_offset = horizontal_offset.split(",")
         horizontal_offset = float(horizontal_offset[4].replace("s", ""))
-        # print(horizontal_offset)
-        # Query the waveform of channel 1 from the scope to the controller. This write command
-        # and the next read command act like a single query command. We are telling the scope
-        # to get the waveform data ready, then reading the raw data into 'recv'
-        self.instrument.write(channel + ":wf? dat2")
+        return {
+            "vdiv": vdiv,
+            "ofst": ofst,
+            "tdiv": tdiv,
+            "sara": sara,
+            "horizontal_offset": horizontal_offset,
+        }
+
+    def invalidate(self) -> None:
+        """
+        Drops the cached preamble so it is queried again on the next waveform. Call this after changing the
+        channel scale, timebase or cursors on the front panel.
+        """
+        self.preamble.invalidate()
+
+    def waveform_slot(self, length: int) -> np.ndarray:
+        """
+        Returns a writable view of the next record of the waveform ring buffer, (re)allocating the ring if the record does not fit.
+
+        Waveforms returned by get_waveform are views of the ring and are overwritten once it wraps around.
+        Reallocating the ring leaves views of the old one valid, as they keep its memory map alive.
+
+        Args:
+            length (int): Number of samples in the record.
+
+        Returns:
+            np.ndarray: View to write the waveform into.
+        """
+        if self.ring is None or not self.ring.fits(length):
+            self.ring = WaveformRingBuffer(self.ring_buffer_records, length)
+        return self.ring.reserve(length)
+
+    def wait_for_averages(self, extra_dwell: float = 0) -> float:
+        """
+        Waits until the requested number of averages has been acquired since ACQUIRE_WAY was written.
+
+        The scope cannot report how many averages it holds, so acquisitions are counted from the new acquisition
+        bit of its INR? register, polled with backoff. Most of the expected time is slept without polling, based on
+        the trigger rate measured during earlier waits, the configured frequency is never trusted.
 
-        recv = list(self.instrument.read_raw())[16:]
+        The bit is a latch, so several acquisitions between two polls count as one. The count is only exact while
+        the trigger rate is below the poll rate, at most 1 / POLL_MIN_INTERVAL = 200 Hz. Above it the count and the
+        measured rate come out low and the wait several times longer than needed (it never ends early). A warning
+        is logged the first time every poll finds a new acquisition; for such fast triggers set adaptive_wait = false and
+        frequency to the trigger rate. Without adaptive_wait this sleeps averages / frequency seconds, plus
+        extra_dwell.
 
-        # Removes elements in 'recv', although can't remember why this is here
-        recv.pop()
-        recv.pop()
+        Args:
+            extra_dwell (float, optional): Extra time in seconds slept when adaptive_wait is off. Defaults to 0.
 
-        # Creating and empty list of y-axis and x-axis data and appending it per iteration.
-        # The reason for the if statements is on page 142 of the programming manual
-        volt_value = []
-        for data in recv:
-            if data > 127:
-                data = data - 256
+        Returns:
+            float: Time in seconds spent waiting.
+        """
+        start = time.perf_counter()
+        averages = int(self.averages)
+        if not self.adaptive_wait:
+            time.sleep(int(averages / self.frequency) + extra_dwell)
+            return time.perf_counter() - start
+
+        acquired = 0.0
+        if self.trigger_rate:
+            blind = 0.8 * averages / self.trigger_rate
+            if blind > self.POLL_MAX_INTERVAL:
+                time.sleep(blind)
+                acquired = self.trigger_rate * blind
+        self.instrument.query("INR?")  # reading clears the register
+
+        seen = 0
+        polls = 0  # polls since the first acquisition seen
+        first_seen = last_seen = time.perf_counter()
+        delay = self.POLL_MIN_INTERVAL
+        while acquired < averages:
+            time.sleep(delay)
+            now = time.perf_counter()
+            polls += seen > 0
+            if self.read_inr() & self.INR_NEW_ACQUISITION:
+                seen += 1
+                acquired += 1
+                if seen == 1:
+                    first_seen = now
+                last_seen = now
+                if seen > 1:
+                    # poll about twice per trigger period
+                    delay = max(self.POLL_MIN_INTERVAL, 0.5 * (last_seen - first_seen) / (seen - 1))
             else:
-                pass
-            volt_value.append(data)
+                if now - last_seen > self.trigger_timeout:
+                    raise DeviceError(
+                        f"No new acquisition for {self.trigger_timeout}s while waiting for {averages} averages. Check the trigger"
+                    )
+                delay = min(delay * 2, self.POLL_MAX_INTERVAL)
+
+        if seen > 1:
+            self.trigger_rate = (seen - 1) / (last_seen - first_seen)
+        if seen > 4 and polls == seen - 1 and not self.fast_trigger_warned:
+            self.fast_trigger_warned = True
+            self.logger.warning(
+                f"Every INR? poll found a new acquisition, the trigger rate is likely above the {1 / self.POLL_MIN_INTERVAL:.0f} Hz poll rate."
+                f" Acquisitions are undercounted and the measured rate {self.trigger_rate:.1f} Hz is a lower bound,"
+                " set adaptive_wait = false and frequency for fast triggers"
+            )
+        waited = time.perf_counter() - start
+        self.logger.debug(
+            f"{averages} averages acquired after {waited:.3f}s, measured trigger rate {self.trigger_rate} Hz"
+        )
+        return waited
 
-        time_value = []
-        for idx in range(0, len(volt_value)):
-            volt_value[idx] = volt_value[idx] / 25 * float(vdiv) - float(ofst)
-            time_data = -(float(tdiv) * 14 / 2) + idx * (1 / sara) - horizontal_offset
-            time_value.append(time_data)
+    def read_inr(self) -> int:
+        """
+        Reads (and so clears) the INR? register, with or without a response header.
 
-        volt_value = np.asarray(volt_value)
-        time_value = np.asarray(time_value)
-        return time_value, volt_value
+        Returns:
+            int: The register value.
+        """
+        response = self.instrument.query("INR?").strip()
+        match = self._NUMBER.match(response.split()[-1]) if response else None
+        if match is None:
+            raise DeviceError(f"Unexpected INR? response: {response!r}")
+        return int(float(match.group()))
 
     def measure_sample(self) -> float:
         """
@@ -190,10 +457,8 @@ class SiglentSDS2352XE(RexSupport):
         Returns: float64
         """
         self.instrument.write(f"ACQUIRE_WAY {self.acquisition_mode},{self.averages}")
-        dwell_time = int(int(self.averages) / self.frequency)
-        time.sleep(dwell_time)
-        time.sleep(1)
-        _, v = self.get_waveform(channel=self.channel)
+        self.wait_for_averages(extra_dwell=1)
+        _, v = self._read_waveform(self.channel)
         if self.reset_per:
             self.instrument.write("ACQUIRE_WAY SAMPLING,1")
         all_negative = np.all(v < 0)
@@ -207,12 +472,90 @@ class SiglentSDS2352XE(RexSupport):
             data=[volts],
             unit="mV",
         )
-        if self.connect_to_rex:
-            payload = self.create_payload()
-            self.tcp_send(payload, self.sock)
+        self.publish_measurements()
 
         return volts
 
+    def read_parameter(self, parameter: str = "AREA", channel: str = None) -> float:
+        """
+        Reads a parameter measurement the scope computes itself, e.g. the area or mean of the waveform
+        over the measurement gate set up on the scope. Only the value crosses the link.
+
+        Args:
+            parameter (str, optional): PAVA parameter name, e.g. AREA or MEAN. Defaults to 'AREA'.
+            channel (str, optional): Channel to measure. Defaults to the configured channel.
+
+        Returns:
+            float: The value in SI units, V.s for AREA and V for MEAN.
+        """
+        channel = channel or self.channel
+        # e.g. 'C1:PAVA AREA,1.23E-06V.s', or just 'AREA,1.23E-06V.s' with chdr off
+        response = self.instrument.query(f"{channel}:PAVA? {parameter}").strip()
+        match = self._NUMBER.match(response.split(",")[-1].strip())
+        if match is None:
+            # the scope returns **** when it cannot measure the parameter
+            raise DeviceError(
+                f"Scope could not measure {parameter} on {channel}, got {response!r}"
+            )
+        return float(match.group())
+
+    def measure_scope_parameter(self) -> float:
+        """
+        Returns the configured scope_parameter (the area by default) as measured by the scope, instead of
+        downloading the waveform. Every verify_every points the waveform is downloaded as well, see verify_parameter.
+
+        Args: Self
+        Returns: float64
+        """
+        self.instrument.write(f"ACQUIRE_WAY {self.acquisition_mode},{self.averages}")
+        self.wait_for_averages(extra_dwell=1)
+        value = self.read_parameter(self.scope_parameter)
+        self.points_measured += 1
+        if self.verify_every and self.points_measured % self.verify_every == 0:
+            self.verify_parameter(value)
+        if self.reset_per:
+            self.instrument.write("ACQUIRE_WAY SAMPLING,1")
+        unit = self.SCOPE_PARAMETERS[self.scope_parameter]
+        self.measurements[f"{self.scope_parameter.lower()} ({unit})"] = Measurement(
+            data=[value],
+            unit=unit,
+        )
+        self.publish_measurements()
+
+        return value
+
+    def verify_parameter(self, scope_value: float) -> float:
+        """
+        Downloads the current waveform and compares the scope's parameter measurement against the same
+        parameter computed on the host: the integral of the waveform for AREA, its average for MEAN.
+
+        The host value covers the transferred window, so the two only agree when the scope's measurement gate
+        spans the same window. Note this is not the baseline subtracted sum returned in area mode.
+
+        Args:
+            scope_value (float): Value returned by read_parameter for the same acquisition.
+
+        Returns:
+            float: Relative difference between the scope and host values.
+        """
+        time_parameters, v = self._read_waveform(self.channel)
+        if self.scope_parameter == "AREA":
+            host_value = float(np.sum(v)) * time_parameters["dt"]
+        else:
+            host_value = float(np.mean(v))
+        scale = max(abs(scope_value), abs(host_value))
+        difference = abs(scope_value - host_value) / scale if scale else 0.0
+        self.verifications.append((scope_value, host_value, difference))
+        if difference > self.verify_tolerance:
+            self.logger.warning(
+                f"Scope {self.scope_parameter} {scope_value:.4g} differs from the host value {host_value:.4g} by {difference:.1%}"
+            )
+        else:
+            self.logger.debug(
+                f"Scope {self.scope_parameter} {scope_value:.4g} matches the host value {host_value:.4g} within {difference:.1%}"
+            )
+        return difference
+
     def measure_trace(self) -> tuple:
         """
         Returns the entire trace/waveform from the osciliscope, where t=0 is defined by the x1 cursor.
@@ -220,17 +563,14 @@ class SiglentSDS2352XE(RexSupport):
         Returns: tuple (time: NDarray f64, voltage: NDarray f64)
         """
         self.instrument.write(f"ACQUIRE_WAY {self.acquisition_mode},{self.averages}")
-        dwell_time = int(int(self.averages) / self.frequency)
-        time.sleep(dwell_time)
+        self.wait_for_averages()
         time_s, voltage = self.get_waveform()
 
         self.measurements = {
             "voltage (mV)": Measurement(data=[], unit="mV"),
             "time (s)": Measurement(data=[], unit="s"),
         }
-        if self.connect_to_rex:
-            payload = self.create_payload()
-            self.tcp_send(payload, self.sock)
+        self.publish_measurements()
         if self.reset_per:
             self.instrument.write("ACQUIRE_WAY SAMPLING,1")
         return time_s, voltage
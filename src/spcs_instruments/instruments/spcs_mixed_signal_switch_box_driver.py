@@ -2,10 +2,12 @@ import time
 
 import serial
 import serial.tools.list_ports
-from rex_utils import Measurement, RexSupport
+from rex_utils import Measurement
 
+from ..rex_support import SpcsRexSupport
 
-class SPCS_mixed_signal_box(RexSupport):
+
+class SPCS_mixed_signal_box(SpcsRexSupport):
     """A class to control and interact with an SPCS Mixed Signal Switch Box.
 
     Attributes:
@@ -354,7 +356,5 @@ class SPCS_mixed_signal_box(RexSupport):
         self.get_state()
         for key, value in self._state.items():
             self.measurements[key] = Measurement(data=[value], unit="dimensionless")
-        if self.connect_to_rex:
-            payload = self.create_payload()
-            self.tcp_send(payload, self.sock)
+        self.publish_measurements()
         return self.measurements
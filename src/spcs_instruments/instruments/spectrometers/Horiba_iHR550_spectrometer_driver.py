@@ -4,10 +4,12 @@ import time
 from typing import Dict
 
 import usb.core
-from rex_utils import Measurement, RexSupport
+from rex_utils import Measurement
 
+from ...rex_support import SpcsRexSupport
 
-class HoribaiHR550(RexSupport):
+
+class HoribaiHR550(SpcsRexSupport):
     """
     A class to control and interface with the Horiba iHR550 Spectrometer via libusb.
 
@@ -516,9 +518,7 @@ class HoribaiHR550(RexSupport):
                 unit="nm",
             )
         }
-        if self.connect_to_rex:
-            payload = self.create_payload()
-            self.tcp_send(payload, self.sock)
+        self.publish_measurements()
         return self.measurements
 
     def get_mirror(self, index: int, timeout: float = 30.0):
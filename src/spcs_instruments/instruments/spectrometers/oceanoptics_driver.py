@@ -1,9 +1,17 @@
+import collections
+import threading
+import time
+
+import numpy as np
 import seabreeze
-from rex_utils import Measurement, RexSupport
+from rex_utils import DeviceError, Measurement
 from seabreeze.spectrometers import Spectrometer
 
+from ...rex_support import ArrayMeasurement, SpcsRexSupport
+from .spectrometer_support import AVERAGING_MODES, SpectrumAverager
+
 
-class Ocean_optics_spectrometer(RexSupport):
+class Ocean_optics_spectrometer(SpcsRexSupport):
     """A class to control and interact with an OceanOptics Spectrometer.
 
     Attributes:
@@ -23,8 +31,20 @@ class Ocean_optics_spectrometer(RexSupport):
                 "_description": "Integration time in microseconds",
             },
             "averages": {"_value": 1, "_description": "Number of averages"},
+            "averaging": {
+                "_value": "auto",
+                "_description": "How spectra are averaged. 'hardware' uses the spectrometer's scans to average, 'host' sums the spectra on the computer, 'auto' uses hardware when the model supports it and host otherwise, 'boxcar' returns the running average of the last averages spectra after reading one new spectrum",
+            },
             "upper_limit": {"_value": 600, "_description": "Upper wavelength range"},
             "lower_limit": {"_value": 500, "_description": "Lower wavelength range"},
+            "free_running": {
+                "_value": False,
+                "_description": "Acquire continuously on a background thread, so measure returns the newest (averaged) spectrum straight away instead of waiting for the integration",
+            },
+            "stale_frames": {
+                "_value": 1,
+                "_description": "In free running mode, spectra discarded by wait_for_fresh after the requested time, as they may have started integrating before it",
+            },
             "backend": {
                 "_value": "pyseabreeze",
                 "_description": "which backend to use to connect, options: 'pyseabreeze', 'cseabreeze'",
@@ -39,7 +59,7 @@ class Ocean_optics_spectrometer(RexSupport):
         super().__init__(name=name)
         self.bind_config(config)
         self.connect_to_rex = connect_to_rex
-        self.config = self.bind_config(config)
+        self._acquisition_thread = None
 
         self.logger.debug(f"{self.name} connected with this config {self.config}")
 
@@ -58,6 +78,7 @@ class Ocean_optics_spectrometer(RexSupport):
         }
 
     def setup_config(self):
+        self.stop_acquisition()
         self.integration_time = self.require_config("integration_time")
         self.lower_limit = self.require_config("lower_limit")
         self.upper_limit = self.require_config("upper_limit")
@@ -66,50 +87,278 @@ class Ocean_optics_spectrometer(RexSupport):
         seabreeze.use(self.backend)
         self.spec = Spectrometer.from_first_available()
         self.spec.integration_time_micros(self.integration_time)
+        # the wavelength calibration is fixed, so the axis is read once
+        self.wavelength = np.asarray(self.spec.wavelengths(), dtype=np.float64)
+        self.set_limits(self.lower_limit, self.upper_limit)
+        self.averaging = self.config.get("averaging", "auto")
+        if self.averaging not in AVERAGING_MODES:
+            raise ValueError(
+                f"averaging must be one of {AVERAGING_MODES}, got {self.averaging}"
+            )
+        # the onboard average replaces the host one, so it is only set up for the block averaging modes
+        self.hardware_averaging = False
+        if self.averaging in ("auto", "hardware"):
+            self.hardware_averaging = self.set_scans_to_average(self.averages)
+            if not self.hardware_averaging and self.averaging == "hardware":
+                self.logger.warning(
+                    f"{self.spec.model} does not support onboard averaging, averaging on the host"
+                )
+        else:
+            self.set_scans_to_average(1)
+        self.averager = SpectrumAverager(
+            self.wavelength.size,
+            1 if self.hardware_averaging else self.averages,
+            boxcar=self.averaging == "boxcar",
+        )
+        self.free_running = self.config.get("free_running", False)
+        self.stale_frames = self.config.get("stale_frames", 1)
+        self.timestamp = None
+        if self.free_running:
+            self.start_acquisition()
+
+    def set_scans_to_average(self, scans: int) -> bool:
+        """
+        Sets the number of scans the spectrometer averages onboard, if seabreeze supports it for the model.
+
+        Args:
+            scans (int): Number of scans per spectrum.
+
+        Returns:
+            bool: Whether the spectrometer supports onboard averaging and the number of scans was set.
+        """
+        processing = self.spec.features.get("spectrum_processing", [])
+        if not processing:
+            return False
+        try:
+            processing[0].set_scans_to_average(int(scans))
+        except Exception as e:
+            # pyseabreeze declares the feature without implementing it for most models
+            self.logger.debug(f"Onboard averaging unavailable: {e}")
+            return False
+        return True
+
+    def set_limits(self, lower_limit: float, upper_limit: float) -> None:
+        """
+        Changes the wavelength range returned by measure, recomputing the slice of the spectrum it covers.
+
+        Args:
+            lower_limit (float): Lower wavelength in nm.
+            upper_limit (float): Upper wavelength in nm.
+        """
+        self.lower_limit = lower_limit
+        self.upper_limit = upper_limit
+        lower_bound, upper_bound = self.bounds(self.wavelength, lower_limit, upper_limit)
+        self.window = slice(lower_bound, upper_bound)
+        self.wavelength_window = self.wavelength[self.window]
 
     def measure(self) -> dict:
-        self.wavelength = None
-        self.intensity = None
         try:
-            if self.averages > 1:
-                for i in range(self.averages):
-                    if self.wavelength is None:
-                        self.wavelength = self.spec.wavelengths()
-                        self.intensity = self.spec.intensities()
-                        self.logger.debug(f"{self.intensity}")
-                    else:
-                        self.intensity += self.spec.intensities()
-                        self.logger.debug(f"{self.intensity}")
-                self.intensity = self.intensity / self.averages
-                self.intensity = self.intensity.tolist()
-                self.wavelength = self.wavelength.tolist()
+            if self.acquiring:
+                return self.measure_latest()
+            if self.averager.boxcar:
+                # one new spectrum per point, averaged with the previous ones
+                self.averager.add(self.spec.intensities())
+                while not self.averager.ready:
+                    self.averager.add(self.spec.intensities())
             else:
-                self.wavelength = self.spec.wavelengths().tolist()
-                self.intensity = self.spec.intensities().tolist()
+                self.averager.reset()
+                for i in range(self.averager.averages):
+                    self.averager.add(self.spec.intensities())
+            self.intensity = self.averager.mean(self.window)
 
-            lower_bound, upper_bound = self.bounds(
-                self.wavelength, self.lower_limit, self.upper_limit
-            )
             self.measurements = {
-                "wavelength (nm)": Measurement(
-                    data=self.wavelength[lower_bound:upper_bound].tolist(),
+                "wavelength (nm)": ArrayMeasurement(
+                    data=self.wavelength_window,
                     unit="nm",
                 ),
-                "intensity (cps)": Measurement(
-                    data=self.intensity[lower_bound:upper_bound].tolist(),
+                "intensity (cps)": ArrayMeasurement(
+                    data=self.intensity,
                     unit="cps",
                 ),
             }
-            if self.connect_to_rex:
-                payload = self.create_payload()
-                self.tcp_send(payload, self.sock)
+            self.publish_measurements()
             return self.measurements
         except Exception as e:
             self.logger.error(f"Error: {e}")
 
-    def bounds(self, data: list, lower_limit: float, upper_limit: float) -> tuple:
-        lower_bound = min(range(len(data)), key=lambda i: abs(data[i] - lower_limit))
-        upper_bound = min(range(len(data)), key=lambda i: abs(data[i] - upper_limit))
-        upper_bound = min(upper_bound + 1, len(data))
+    def measure_latest(self, timeout: float = None) -> dict:
+        """
+        Returns the newest average of the background acquisition without waiting for a new integration,
+        unless no complete average has been acquired yet.
+
+        Args:
+            timeout (float, optional): Time in seconds to wait for the first complete average. Defaults to the expected time plus 10s.
+
+        Returns:
+            dict: The measurements, with the time the newest spectrum completed as "timestamp (s)".
+        """
+        timeout = timeout if timeout is not None else self._expected_wait()
+        with self._frame_ready:
+            if not self._frame_ready.wait_for(
+                lambda: self.averager.ready or self._acquisition_error is not None,
+                timeout,
+            ):
+                raise DeviceError(f"No spectrum acquired within {timeout}s")
+            if self._acquisition_error is not None:
+                raise DeviceError(
+                    f"Background acquisition failed: {self._acquisition_error}"
+                )
+            self.intensity = self.averager.mean(self.window)
+            self.timestamp = self._frame_completed
+
+        self.measurements = {
+            "wavelength (nm)": ArrayMeasurement(
+                data=self.wavelength_window,
+                unit="nm",
+            ),
+            "intensity (cps)": ArrayMeasurement(
+                data=self.intensity,
+                unit="cps",
+            ),
+            "timestamp (s)": Measurement(
+                data=[self.timestamp],
+                unit="s",
+            ),
+        }
+        self.publish_measurements()
+        return self.measurements
+
+    def wait_for_fresh(self, after: float = None, timeout: float = None) -> float:
+        """
+        Waits until every spectrum in the newest average was requested after a given time, e.g. once a stage move
+        has finished, so measure never returns light integrated before it. The stale_frames spectra requested
+        first are skipped as well, since the detector may already have been integrating them.
+
+        Args:
+            after (float, optional): time.time() after which the spectra must start. Defaults to now.
+            timeout (float, optional): Time in seconds to wait. Defaults to the expected time plus 10s.
+
+        Returns:
+            float: time.time() at which the newest spectrum completed.
+        """
+        if not self.acquiring:
+            raise DeviceError("wait_for_fresh needs the background acquisition running")
+        after = time.time() if after is None else after
+        timeout = timeout if timeout is not None else self._expected_wait()
+        with self._frame_ready:
+            if not self._frame_ready.wait_for(
+                lambda: self._acquisition_error is not None
+                or (
+                    len(self._frame_requests) == self._frame_requests.maxlen
+                    and self._frame_requests[0] >= after
+                ),
+                timeout,
+            ):
+                raise DeviceError(
+                    f"No fresh spectrum acquired within {timeout}s after {after}"
+                )
+            if self._acquisition_error is not None:
+                raise DeviceError(
+                    f"Background acquisition failed: {self._acquisition_error}"
+                )
+            return self._frame_completed
+
+    @property
+    def acquiring(self) -> bool:
+        """Whether the background acquisition is running."""
+        return self._acquisition_thread is not None
+
+    def start_acquisition(self):
+        """
+        Starts acquiring spectra continuously on a background thread.
+
+        Each spectrum is read outside the lock and then swapped into a running boxcar of the last averages spectra
+        (a single spectrum with onboard averaging), so measure returns straight away while the next spectrum
+        integrates, and stage moves overlap with the integration.
+        """
+        if self.acquiring:
+            return
+        self.averager = SpectrumAverager(
+            self.wavelength.size, self.averager.averages, boxcar=True
+        )
+        # request times of the spectra in the current average, and of the stale ones before it
+        self._frame_requests = collections.deque(
+            maxlen=self.averager.averages + self.stale_frames
+        )
+        self._frame_completed = None
+        self._frame_ready = threading.Condition()
+        self._acquisition_stop = threading.Event()
+        self._acquisition_error = None
+        self._acquisition_thread = threading.Thread(
+            target=self._acquisition_worker, name=f"{self.name}-acquisition", daemon=True
+        )
+        self._acquisition_thread.start()
+        self.logger.debug(f"{self.name} background acquisition started.")
+
+    def stop_acquisition(self):
+        """
+        Stops the background acquisition, waiting for the spectrum being read to complete.
+        """
+        if not self.acquiring:
+            return
+        self._acquisition_stop.set()
+        self._acquisition_thread.join()
+        self._acquisition_thread = None
+        self.averager = SpectrumAverager(
+            self.wavelength.size,
+            self.averager.averages,
+            boxcar=self.averaging == "boxcar",
+        )
+        self.logger.debug(f"{self.name} background acquisition stopped.")
+
+    def _acquisition_worker(self):
+        try:
+            while not self._acquisition_stop.is_set():
+                requested = time.time()
+                frame = self.spec.intensities()
+                with self._frame_ready:
+                    self.averager.add(frame)
+                    self._frame_requests.append(requested)
+                    self._frame_completed = time.time()
+                    self._frame_ready.notify_all()
+        except Exception as e:
+            self.logger.error(f"{self.name} background acquisition failed: {e}")
+            with self._frame_ready:
+                self._acquisition_error = e
+                self._frame_ready.notify_all()
+
+    def _expected_wait(self) -> float:
+        frames = self.averager.averages + self.stale_frames
+        scans = self.averages if self.hardware_averaging else 1
+        return frames * scans * self.integration_time * 1e-6 + 10
+
+    def close(self):
+        """
+        Stops the background acquisition and releases the spectrometer, after sending anything still queued for rex.
+        """
+        self.stop_acquisition()
+        self.flush_rex()
+        self.spec.close()
+
+    def bounds(self, data: np.ndarray, lower_limit: float, upper_limit: float) -> tuple:
+        """
+        Finds the slice of an ascending wavelength axis from the point nearest lower_limit to the point nearest upper_limit, inclusive.
+
+        Args:
+            data (np.ndarray): Wavelength axis in nm.
+            lower_limit (float): Lower wavelength in nm.
+            upper_limit (float): Upper wavelength in nm.
+
+        Returns:
+            tuple: (lower_bound, upper_bound) slice indices.
+        """
+        data = np.asarray(data)
+        lower_bound = self._nearest(data, lower_limit)
+        upper_bound = min(self._nearest(data, upper_limit) + 1, len(data))
 
         return lower_bound, upper_bound
+
+    @staticmethod
+    def _nearest(data: np.ndarray, value: float) -> int:
+        """Index of the point of the ascending array data nearest value, the lower one on a tie."""
+        index = int(np.searchsorted(data, value))
+        if index == len(data) or (
+            index > 0 and value - data[index - 1] <= data[index] - value
+        ):
+            index -= 1
+        return max(index, 0)
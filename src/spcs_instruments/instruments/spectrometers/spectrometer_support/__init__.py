@@ -0,0 +1,6 @@
+from .averaging import AVERAGING_MODES, SpectrumAverager
+
+__all__ = [
+    "AVERAGING_MODES",
+    "SpectrumAverager",
+]
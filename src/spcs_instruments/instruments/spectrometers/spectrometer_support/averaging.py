@@ -0,0 +1,81 @@
+import numpy as np
+
+AVERAGING_MODES = ("auto", "hardware", "host", "boxcar")
+
+
+class SpectrumAverager:
+    """
+    Averages spectra into preallocated buffers, so the cost per spectrum does not grow with use.
+
+    In block mode every average starts afresh from `averages` new frames. In boxcar mode the last
+    `averages` frames are kept in a ring and the running sum is updated by one frame in and one frame
+    out, so each new frame gives a new average. The running sum is recomputed from the ring every
+    time it wraps, so rounding errors cannot build up.
+
+    Attributes:
+        averages (int): Number of frames per average.
+        boxcar (bool): Whether a running boxcar average is kept.
+        count (int): Number of frames in the current average.
+    """
+
+    def __init__(self, pixels: int, averages: int, boxcar: bool = False):
+        """
+        Args:
+            pixels (int): Number of pixels per spectrum.
+            averages (int): Number of frames per average.
+            boxcar (bool, optional): Keep a running boxcar average instead of block averages. Defaults to False.
+        """
+        self.averages = max(int(averages), 1)
+        self.boxcar = boxcar
+        self.sum = np.zeros(pixels, dtype=np.float64)
+        self.frames = (
+            np.zeros((self.averages, pixels), dtype=np.float64) if boxcar else None
+        )
+        self.reset()
+
+    def reset(self) -> None:
+        """Discards the frames accumulated so far."""
+        self.count = 0
+        self._next = 0
+        self.sum.fill(0.0)
+
+    @property
+    def ready(self) -> bool:
+        """Whether the average holds `averages` frames."""
+        return self.count >= self.averages
+
+    def add(self, frame) -> None:
+        """
+        Adds a frame, replacing the oldest one in boxcar mode once the ring is full.
+
+        Args:
+            frame (np.ndarray): Intensities of every pixel.
+        """
+        if not self.boxcar:
+            self.sum += frame
+            self.count += 1
+            return
+        slot = self.frames[self._next]
+        if self.count == self.averages:
+            self.sum -= slot
+        else:
+            self.count += 1
+        slot[:] = frame
+        self.sum += slot
+        self._next += 1
+        if self._next == self.averages:
+            self._next = 0
+            if self.count == self.averages:
+                np.sum(self.frames, axis=0, out=self.sum)
+
+    def mean(self, window: slice = slice(None)) -> np.ndarray:
+        """
+        Returns the average of the frames held, over a window of pixels.
+
+        Args:
+            window (slice, optional): Pixels to return. Defaults to every pixel.
+
+        Returns:
+            np.ndarray: A new array, safe to publish while averaging carries on.
+        """
+        return self.sum[window] / max(self.count, 1)
@@ -1,7 +1,9 @@
-from rex_utils import Measurement, RexSupport
+from rex_utils import Measurement
 
+from ...rex_support import SpcsRexSupport
 
-class Test_spectrometer(RexSupport):
+
+class Test_spectrometer(SpcsRexSupport):
     """
     A basic mock spectrometer class.
     """
@@ -58,9 +60,7 @@ class Test_spectrometer(RexSupport):
                 unit="nm",
             )
         }
-        if self.connect_to_rex:
-            payload = self.create_payload()
-            self.tcp_send(payload, self.sock)
+        self.publish_measurements()
         return self.measurements
 
     def set_wavelength(self, wavelength):
@@ -1,10 +1,12 @@
 import random as rd
 
 import numpy as np
-from rex_utils import Measurement, RexSupport
+from rex_utils import Measurement
 
+from ..rex_support import ArrayMeasurement, SpcsRexSupport
 
-class Test_daq(RexSupport):
+
+class Test_daq(SpcsRexSupport):
     __toml_config__ = {
         "device.Test_DAQ": {
             "_section_description": "Test_DAQ measurement configuration",
@@ -60,18 +62,16 @@ class Test_daq(RexSupport):
             noise = np.random.normal(0.0, 0.1, 20)
             trace_data = np.exp(-time) + noise
 
-            self.measurements["trace (signal)"] = Measurement(
-                data=trace_data.tolist(),
+            self.measurements["trace (signal)"] = ArrayMeasurement(
+                data=trace_data,
                 unit="V",
             )
 
-            self.measurements["trace (time (s))"] = Measurement(
-                data=time.tolist(),
+            self.measurements["trace (time (s))"] = ArrayMeasurement(
+                data=time,
                 unit="s",
             )
 
         self.state += 1
-        if self.connect_to_rex:
-            payload = self.create_payload()
-            self.tcp_send(payload, self.sock)
+        self.publish_measurements()
         return data
@@ -0,0 +1,3 @@
+from .discovery import clear_cache, find_resource
+
+__all__ = ["clear_cache", "find_resource"]
@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+logger = logging.getLogger("rex.visa_discovery")
+
+DEFAULT_CACHE_PATH = Path(
+    os.environ.get(
+        "SPCS_VISA_CACHE",
+        Path.home() / ".cache" / "spcs_instruments" / "visa_resources.json",
+    )
+)
+DEFAULT_PROBE_TIMEOUT = 0.5
+MAX_PROBE_WORKERS = 16
+
+_lock = threading.Lock()
+
+
+def find_resource(
+    rm,
+    identifier: str,
+    read_termination: str = None,
+    probe_timeout: float = DEFAULT_PROBE_TIMEOUT,
+    cache_path: Path = DEFAULT_CACHE_PATH,
+):
+    """
+    Finds and opens the VISA resource whose *IDN? response contains identifier.
+
+    The address the instrument was last found at is read from the cache and checked with a single
+    *IDN? query. Only if that fails are all resources probed, concurrently and with a short timeout.
+    Resources that do not match are closed again, and the address found is written back to the cache
+    for the next start.
+
+    Args:
+        rm (pyvisa.ResourceManager): Resource manager to open resources with.
+        identifier (str): Part of the *IDN? response identifying the instrument.
+        read_termination (str, optional): Read termination to set before querying. Left at the VISA default if None.
+        probe_timeout (float, optional): Timeout in seconds of each *IDN? probe. Defaults to 0.5.
+        cache_path (Path, optional): JSON file holding the identifier to address cache.
+
+    Returns:
+        pyvisa.resources.Resource | None: The open resource, with its original timeout restored, or None if not found.
+    """
+    with _lock:
+        cache = _load_cache(cache_path)
+        address = cache.get(identifier)
+        if address is not None:
+            resource = _probe(rm, address, identifier, read_termination, probe_timeout)
+            if resource is not None:
+                logger.debug(f"{identifier} found at cached address {address}")
+                return resource
+            logger.info(f"{identifier} no longer at cached address {address}, probing all resources")
+
+        try:
+            addresses = [a for a in rm.list_resources() if a != address]
+        except Exception as e:
+            logger.error(f"Could not list VISA resources: {e}")
+            return None
+        if not addresses:
+            return None
+
+        with ThreadPoolExecutor(max_workers=min(MAX_PROBE_WORKERS, len(addresses))) as pool:
+            probed = list(
+                pool.map(
+                    lambda a: _probe(rm, a, identifier, read_termination, probe_timeout),
+                    addresses,
+                )
+            )
+        matches = [resource for resource in probed if resource is not None]
+        if not matches:
+            return None
+        # several matching instruments: keep the first in list order, as the serial search did
+        resource = matches[0]
+        for extra in matches[1:]:
+            extra.close()
+
+        cache[identifier] = resource.resource_name
+        _save_cache(cache_path, cache)
+        logger.debug(f"{identifier} found at {resource.resource_name}")
+        return resource
+
+
+def clear_cache(cache_path: Path = DEFAULT_CACHE_PATH) -> None:
+    """Removes the cached instrument addresses, so the next search probes every resource."""
+    with _lock:
+        Path(cache_path).unlink(missing_ok=True)
+
+
+def _probe(rm, address, identifier, read_termination, probe_timeout):
+    """Opens address and returns it if its *IDN? response contains identifier, closing it otherwise."""
+    try:
+        resource = rm.open_resource(address)
+    except Exception as e:
+        logger.debug(f"Could not open {address}: {e}")
+        return None
+    try:
+        if read_termination is not None:
+            resource.read_termination = read_termination
+        timeout = resource.timeout
+        resource.timeout = probe_timeout * 1000
+        try:
+            idn = resource.query("*IDN?").strip()
+        finally:
+            resource.timeout = timeout
+        if identifier in idn:
+            return resource
+        logger.debug(f"{address} is {idn}")
+    except Exception as e:
+        logger.debug(f"No *IDN? response from {address}: {e}")
+    try:
+        resource.close()
+    except Exception:
+        pass
+    return None
+
+
+def _load_cache(cache_path: Path) -> dict:
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache_path: Path, cache: dict) -> None:
+    cache_path = Path(cache_path)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Could not write VISA resource cache {cache_path}: {e}")
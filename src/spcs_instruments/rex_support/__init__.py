@@ -0,0 +1,31 @@
+from .base import SpcsRexSupport
+from .batching import PayloadAggregator, configure_batching, get_aggregator
+from .connection import RexConnection, configure_reconnect, get_connection
+from .encoding import ArrayMeasurement
+from .recorder import (
+    MeasurementRecorder,
+    get_recorder,
+    scan_recording,
+    start_recording,
+    stop_recording,
+)
+from .sender import AsyncSender, configure_async, get_sender
+
+__all__ = [
+    "SpcsRexSupport",
+    "PayloadAggregator",
+    "configure_batching",
+    "get_aggregator",
+    "ArrayMeasurement",
+    "RexConnection",
+    "get_connection",
+    "configure_reconnect",
+    "AsyncSender",
+    "configure_async",
+    "get_sender",
+    "MeasurementRecorder",
+    "get_recorder",
+    "scan_recording",
+    "start_recording",
+    "stop_recording",
+]
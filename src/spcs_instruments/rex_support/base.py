@@ -0,0 +1,128 @@
+import atexit
+
+from rex_utils import RexSupport
+from rex_utils.structs import validate_device_payload
+
+from .batching import get_aggregator
+from .connection import DEFAULT_SHARED, RexConnection, close_connections, get_connection
+from .encoding import ArrayMeasurement
+from .framing import encode_payload
+from .recorder import get_recorder
+from .sender import get_sender
+
+
+class SpcsRexSupport(RexSupport):
+    """
+    RexSupport with the transport used by every spcs-instruments driver.
+
+    `tcp_connect` hands out one Rex connection shared by every driver in the process rather than
+    opening a socket per driver. Payloads sent through `tcp_send` are tagged with the device name and
+    handed to the background sender when the asynchronous send mode is enabled, so `measure()` never
+    blocks on the Rex socket. Otherwise they are routed through the process wide payload aggregator,
+    so measurements from all drivers are coalesced into batched socket writes when batching is enabled.
+
+    `publish_measurements` is called at the end of every `measure()`. It records the measurements locally
+    when a recorder is active and sends them to Rex when the driver is connected.
+
+    Drivers may store traces as ArrayMeasurements. These are sent as raw binary buffers when the
+    connection supports it and as lists otherwise.
+    """
+
+    shared_connection = DEFAULT_SHARED
+
+    def tcp_connect(self, host="127.0.0.1"):
+        if not self.shared_connection:
+            return super().tcp_connect(host)
+        connection = get_connection(host, int(self.port))
+        self.logger.debug(f"{self.name} using shared connection to {host}:{self.port}")
+        return connection
+
+    def create_payload(self) -> dict:
+        """Create validated device payload, keeping ArrayMeasurements binary if the Rex connection accepts it"""
+        arrays = {
+            name: measurement
+            for name, measurement in self.measurements.items()
+            if isinstance(measurement, ArrayMeasurement)
+        }
+        if not arrays:
+            return super().create_payload()
+
+        binary = getattr(getattr(self, "sock", None), "binary", False)
+        try:
+            payload = validate_device_payload(
+                device_name=self.name,
+                device_config=self.config,
+                measurements={
+                    name: measurement
+                    for name, measurement in self.measurements.items()
+                    if name not in arrays
+                },
+            )
+        except Exception as e:
+            self.logger.error(f"❌ Payload validation failed: {e}")
+            raise
+        validated = payload["measurements"]
+        payload["measurements"] = {
+            name: (
+                validated[name]
+                if name not in arrays
+                else arrays[name] if binary else arrays[name].to_payload()
+            )
+            for name in self.measurements
+        }
+        return payload
+
+    def tcp_send(self, payload, sock):
+        payload.setdefault("device_name", self.name)
+        sender = get_sender()
+        if sender.enabled:
+            sender.submit(sock, payload)
+            return None
+        aggregator = get_aggregator()
+        if aggregator.enabled:
+            aggregator.submit(sock, payload)
+            self.logger.debug(f"data being buffered:{payload}")
+            return None
+        if not isinstance(sock, RexConnection):
+            return super().tcp_send(payload, sock)
+        response = sock.write([encode_payload(payload)])
+        self.logger.debug(f"Server response: {response}")
+        return response
+
+    def publish_measurements(self) -> None:
+        """
+        Records the current measurements and sends them to Rex if connected.
+        """
+        recorder = get_recorder()
+        if recorder is not None:
+            recorder.record(self.name, self.measurements)
+        if self.connect_to_rex:
+            payload = self.create_payload()
+            self.tcp_send(payload, self.sock)
+
+    def flush_rex(self, timeout: float = None) -> None:
+        """
+        Writes out any payloads still queued or buffered for Rex.
+
+        Args:
+            timeout (float, optional): Maximum time in seconds to wait for the background sender.
+        """
+        sender = get_sender()
+        if sender.enabled and not sender.flush(timeout):
+            self.logger.warning(
+                f"{self.name} timed out flushing payloads queued for Rex"
+            )
+        sock = getattr(self, "sock", None)
+        if sock is not None:
+            get_aggregator().flush(sock)
+
+
+@atexit.register
+def _shutdown() -> None:
+    # drain in order: background sender, then batches, then the shared connections, then the recording
+    get_sender().close()
+    get_aggregator().close()
+    close_connections()
+    recorder = get_recorder()
+    if recorder is not None:
+        recorder.flush()
@@ -0,0 +1,186 @@
+import logging
+import os
+import socket
+import threading
+import time
+
+from .connection import send_frames
+from .framing import encode_payload, frame_bytes
+
+logger = logging.getLogger("rex.batching")
+
+DEFAULT_MAX_BATCH = int(os.environ.get("SPCS_REX_BATCH_SIZE", "1"))
+DEFAULT_MAX_LATENCY = float(os.environ.get("SPCS_REX_MAX_LATENCY", "0.25"))
+
+
+class PayloadAggregator:
+    """
+    Per-process buffer that coalesces device payloads into batched socket writes.
+
+    Payloads are grouped by the socket they are destined for and written as a single
+    framed batch once `max_batch` payloads are pending, or once the oldest pending payload
+    is `max_latency` seconds old, whichever comes first. A `max_batch` of 1 disables
+    buffering and every payload is written immediately.
+
+    Attributes:
+        max_batch (int): Number of payloads that triggers a flush.
+        max_latency (float): Maximum time in seconds a payload may wait before being written.
+        payloads (int): Total number of payloads submitted.
+        writes (int): Total number of socket writes issued.
+    """
+
+    def __init__(
+        self,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_latency: float = DEFAULT_MAX_LATENCY,
+        writer=send_frames,
+    ):
+        self.max_batch = max(1, int(max_batch))
+        self.max_latency = float(max_latency)
+        self.writer = writer
+        self.payloads = 0
+        self.writes = 0
+        self._pending = {}
+        self._deadlines = {}
+        self._lock = threading.Condition()
+        self._write_lock = threading.RLock()
+        self._flusher = None
+        self._closed = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch > 1
+
+    def configure(self, max_batch: int = None, max_latency: float = None) -> None:
+        """
+        Updates the flush thresholds, flushing anything pending under the old settings first.
+
+        Args:
+            max_batch (int, optional): Number of payloads that triggers a flush.
+            max_latency (float, optional): Maximum age in seconds of a pending payload.
+        """
+        self.flush()
+        with self._lock:
+            if max_batch is not None:
+                self.max_batch = max(1, int(max_batch))
+            if max_latency is not None:
+                self.max_latency = float(max_latency)
+            self._lock.notify()
+
+    def submit(self, sock: socket.socket, payload: dict) -> None:
+        """
+        Queues a payload for the given socket, flushing the batch if it is full.
+
+        Args:
+            sock (socket.socket): Connected Rex socket the payload is destined for.
+            payload (dict): Validated device payload.
+        """
+        self.submit_frames(sock, [encode_payload(payload)])
+
+    def submit_frames(self, sock: socket.socket, frames: list) -> None:
+        """
+        Queues already encoded payloads for the given socket, flushing the batch if it is full.
+
+        Binary frames are copied out of the driver's arrays, which may be reused before the batch is written.
+
+        Args:
+            sock (socket.socket): Connected Rex socket the frames are destined for.
+            frames (list): Encoded payloads from encode_payload.
+        """
+        frames = [frame_bytes(frame) for frame in frames]
+        with self._lock:
+            pending = self._pending.setdefault(sock, [])
+            if not pending:
+                self._deadlines[sock] = time.monotonic() + self.max_latency
+            pending.extend(frames)
+            self.payloads += len(frames)
+            full = len(pending) >= self.max_batch
+            if not full:
+                self._start_flusher()
+                self._lock.notify()
+        if full:
+            self.flush(sock)
+
+    def flush(self, sock: socket.socket = None) -> None:
+        """
+        Writes out pending payloads.
+
+        Args:
+            sock (socket.socket, optional): Only flush payloads for this socket. Flushes every socket if None.
+        """
+        with self._write_lock:
+            with self._lock:
+                targets = [sock] if sock is not None else list(self._pending)
+                batches = [(s, self._take(s)) for s in targets]
+            for target, frames in batches:
+                if frames:
+                    self.writer(target, frames)
+                    self.writes += 1
+                    logger.debug(f"Flushed {len(frames)} payloads in one write")
+
+    def close(self) -> None:
+        """Flushes everything pending and stops the latency flusher."""
+        with self._lock:
+            self._closed = True
+            self._lock.notify()
+        try:
+            self.flush()
+        except OSError as e:
+            logger.error(f"Could not flush pending Rex payloads: {e}")
+
+    def _take(self, sock: socket.socket) -> list:
+        self._deadlines.pop(sock, None)
+        return self._pending.pop(sock, [])
+
+    def _start_flusher(self) -> None:
+        if self._flusher is None or not self._flusher.is_alive():
+            self._closed = False
+            self._flusher = threading.Thread(
+                target=self._flush_overdue, name="rex-batch-flusher", daemon=True
+            )
+            self._flusher.start()
+
+    def _flush_overdue(self) -> None:
+        with self._lock:
+            while not self._closed:
+                if not self._deadlines:
+                    self._lock.wait()
+                    continue
+                sock, due = min(self._deadlines.items(), key=lambda item: item[1])
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._lock.wait(delay)
+                    continue
+                self._lock.release()
+                try:
+                    self.flush(sock)
+                except OSError as e:
+                    logger.error(f"Dropped a batch of Rex payloads: {e}")
+                finally:
+                    self._lock.acquire()
+
+
+_aggregator = None
+_aggregator_lock = threading.Lock()
+
+
+def get_aggregator() -> PayloadAggregator:
+    """Returns the process wide payload aggregator, creating it on first use."""
+    global _aggregator
+    with _aggregator_lock:
+        if _aggregator is None:
+            _aggregator = PayloadAggregator()
+        return _aggregator
+
+
+def configure_batching(max_batch: int = None, max_latency: float = None) -> None:
+    """
+    Configures the process wide payload aggregator used by every driver.
+
+    Defaults are read from the SPCS_REX_BATCH_SIZE and SPCS_REX_MAX_LATENCY environment variables.
+
+    Args:
+        max_batch (int, optional): Payloads per batch, 1 disables batching.
+        max_latency (float, optional): Maximum time in seconds a payload is held back, keeps live plots updating.
+    """
+    get_aggregator().configure(max_batch=max_batch, max_latency=max_latency)
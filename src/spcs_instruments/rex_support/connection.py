@@ -0,0 +1,321 @@
+import logging
+import os
+import itertools
+import socket
+import threading
+import time
+from collections import deque
+
+from .framing import frame_bytes, write_frames
+
+logger = logging.getLogger("rex.connection")
+
+DEFAULT_SHARED = os.environ.get("SPCS_REX_SHARED", "1").lower() in ("1", "true", "yes")
+DEFAULT_REPLAY_SIZE = int(os.environ.get("SPCS_REX_REPLAY_SIZE", "10000"))
+DEFAULT_BINARY = os.environ.get("SPCS_REX_BINARY", "0").lower() in ("1", "true", "yes")
+DEFAULT_MAX_RETRIES = int(os.environ.get("SPCS_REX_MAX_RETRIES", "3"))
+DEFAULT_RETRY_DELAY = float(os.environ.get("SPCS_REX_RETRY_DELAY", "0.5"))
+DEFAULT_RETRY_INTERVAL = float(os.environ.get("SPCS_REX_RETRY_INTERVAL", "5.0"))
+
+
+class RexConnection:
+    """
+    A single TCP connection to Rex shared by every driver in the process.
+
+    Instead of each driver opening its own socket, drivers write their (device name tagged)
+    payloads through one connection. If the link drops mid-scan the connection is re-established
+    with exponential backoff and any payloads that were not delivered are replayed in order.
+    While Rex is unreachable payloads are held in a bounded replay buffer, so a scan keeps
+    running and the data is sent once the link is back.
+
+    Rex acknowledges every payload with one line. Payloads stay in the replay buffer until their
+    acknowledgement has been read, including acknowledgements picked up by later writes, so only
+    unacknowledged payloads are replayed. Delivery is at least once: a payload Rex stored but
+    could not acknowledge before the link dropped is stored again when it is replayed.
+
+    The backoff runs on whichever thread writes. With the asynchronous send mode that is the sender
+    thread, otherwise it is the driver's `measure()`, which can stall for up to
+    retry_delay * (2 ** (max_retries - 1) - 1) seconds. Set max_retries to 1 to never wait there,
+    payloads are then buffered and another attempt is made every retry_interval.
+
+    Attributes:
+        host (str): Rex server address.
+        port (int): Rex server port.
+        replay_size (int): Maximum number of undelivered payloads kept for replay.
+        max_retries (int): Reconnection attempts made when the link drops, at least 1.
+        retry_delay (float): Initial delay in seconds between reconnection attempts, doubled after each attempt.
+        retry_interval (float): Time in seconds before trying again after all attempts failed.
+        binary (bool): Whether the Rex server accepts binary array payloads. Older servers only understand the list encoding.
+        reconnects (int): Number of times the link has been re-established.
+        writes (int): Number of socket writes issued.
+        pending (int): Number of payloads not yet acknowledged by Rex.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        replay_size: int = DEFAULT_REPLAY_SIZE,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        retry_delay: float = DEFAULT_RETRY_DELAY,
+        retry_interval: float = DEFAULT_RETRY_INTERVAL,
+        binary: bool = DEFAULT_BINARY,
+    ):
+        self.host = host
+        self.port = port
+        self.replay_size = replay_size
+        self.max_retries = max(1, int(max_retries))
+        self.retry_delay = retry_delay
+        self.retry_interval = retry_interval
+        self.binary = binary
+        self.reconnects = 0
+        self.writes = 0
+        self._sock = None
+        # unacknowledged payloads, the first _in_flight of them already written to the current socket
+        self._backlog = deque()
+        self._in_flight = 0
+        # acknowledgements still to come for sent payloads discarded from a full replay buffer
+        self._stale_acks = 0
+        self._next_attempt = 0.0
+        self._lock = threading.RLock()
+
+    @property
+    def connected(self) -> bool:
+        return self._sock is not None
+
+    @property
+    def pending(self) -> int:
+        return len(self._backlog)
+
+    def configure(
+        self,
+        max_retries: int = None,
+        retry_delay: float = None,
+        retry_interval: float = None,
+    ) -> None:
+        """
+        Updates the reconnection backoff.
+
+        Args:
+            max_retries (int, optional): Reconnection attempts made when the link drops, at least 1.
+            retry_delay (float, optional): Initial delay in seconds between attempts, doubled after each attempt.
+            retry_interval (float, optional): Time in seconds before trying again after all attempts failed.
+        """
+        with self._lock:
+            if max_retries is not None:
+                self.max_retries = max(1, int(max_retries))
+            if retry_delay is not None:
+                self.retry_delay = float(retry_delay)
+            if retry_interval is not None:
+                self.retry_interval = float(retry_interval)
+            self._next_attempt = 0.0
+
+    def connect(self) -> bool:
+        """
+        Opens the socket to Rex.
+
+        Returns:
+            bool: True if the connection was established.
+        """
+        with self._lock:
+            if self._sock is not None:
+                return True
+            try:
+                self._sock = socket.create_connection((self.host, self.port))
+                logger.debug(f"Connected to Rex at {self.host}:{self.port}")
+                return True
+            except OSError as e:
+                logger.error(
+                    f"Could not connect to server at {self.host}:{self.port}: {e}"
+                )
+                return False
+
+    def write(self, frames: list) -> str:
+        """
+        Writes encoded payloads, reconnecting and replaying unacknowledged payloads if the link has dropped.
+
+        Args:
+            frames (list): Encoded payloads from encode_payload.
+
+        Returns:
+            str: The server response, empty if the payloads were buffered for replay.
+        """
+        with self._lock:
+            self._backlog.extend(frames)
+            overflow = len(self._backlog) - self.replay_size
+            if overflow > 0:
+                for _ in range(overflow):
+                    self._backlog.popleft()
+                discarded_in_flight = min(overflow, self._in_flight)
+                self._in_flight -= discarded_in_flight
+                self._stale_acks += discarded_in_flight
+                logger.warning(
+                    f"Rex replay buffer full, discarded {overflow} undelivered payloads"
+                )
+
+            response = ""
+            for _ in range(2):
+                if self._sock is None and not self._reconnect():
+                    break
+                unsent = list(itertools.islice(self._backlog, self._in_flight, None))
+                if not unsent:
+                    break
+                try:
+                    response = write_frames(self._sock, unsent)
+                except OSError as e:
+                    logger.error(f"Lost connection to Rex: {e}")
+                    self._drop()
+                    continue
+                self.writes += 1
+                self._in_flight += len(unsent)
+                self._acknowledge(response.count("\n"))
+                break
+            self._hold()
+            return response
+
+    def close(self) -> None:
+        """Closes the socket, after waiting briefly for outstanding acknowledgements. Payloads that could not be delivered are reported and discarded."""
+        with self._lock:
+            if self._in_flight and self._sock is not None:
+                self._await_acks(timeout=1.0)
+            if self._backlog:
+                logger.error(
+                    f"{len(self._backlog)} payloads could not be delivered to Rex"
+                )
+                self._backlog.clear()
+            self._drop()
+
+    def _acknowledge(self, acks: int) -> None:
+        ignored = min(acks, self._stale_acks)
+        self._stale_acks -= ignored
+        acknowledged = min(acks - ignored, self._in_flight)
+        for _ in range(acknowledged):
+            self._backlog.popleft()
+        self._in_flight -= acknowledged
+
+    def _await_acks(self, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        try:
+            while self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                self._sock.settimeout(remaining)
+                response = self._sock.recv(65536)
+                if not response:
+                    return
+                self._acknowledge(response.count(b"\n"))
+        except OSError:
+            pass
+
+    def _hold(self) -> None:
+        # frames kept for replay may be zero-copy views of driver buffers that the next acquisition overwrites
+        self._backlog = deque(frame_bytes(frame) for frame in self._backlog)
+
+    def _drop(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+        # acknowledgements of payloads written to the old socket will never arrive, they are written again
+        self._in_flight = 0
+        self._stale_acks = 0
+
+    def _reconnect(self) -> bool:
+        if time.monotonic() < self._next_attempt:
+            return False
+        delay = self.retry_delay
+        for attempt in range(self.max_retries):
+            if attempt:
+                time.sleep(delay)
+                delay *= 2
+            if self.connect():
+                self.reconnects += 1
+                logger.info(
+                    f"Reconnected to Rex, replaying {len(self._backlog)} payloads"
+                )
+                return True
+        self._next_attempt = time.monotonic() + self.retry_interval
+        logger.error(
+            f"Rex unreachable, buffering payloads and retrying in {self.retry_interval}s"
+        )
+        return False
+
+
+def send_frames(target, frames: list) -> str:
+    """
+    Writes encoded payloads to either a shared RexConnection or a plain socket.
+
+    Args:
+        target (RexConnection | socket.socket): Where the payloads are written.
+        frames (list): Encoded payloads from encode_payload.
+
+    Returns:
+        str: The server response.
+    """
+    if isinstance(target, RexConnection):
+        return target.write(frames)
+    return write_frames(target, frames)
+
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def get_connection(host: str, port: int) -> RexConnection:
+    """
+    Returns the process wide connection to the Rex server at host:port, connecting on first use.
+
+    Args:
+        host (str): Rex server address.
+        port (int): Rex server port.
+    """
+    with _connections_lock:
+        connection = _connections.get((host, port))
+        if connection is None:
+            connection = _connections[(host, port)] = RexConnection(
+                host,
+                port,
+                max_retries=DEFAULT_MAX_RETRIES,
+                retry_delay=DEFAULT_RETRY_DELAY,
+                retry_interval=DEFAULT_RETRY_INTERVAL,
+            )
+            connection.connect()
+        return connection
+
+
+def configure_reconnect(
+    max_retries: int = None,
+    retry_delay: float = None,
+    retry_interval: float = None,
+) -> None:
+    """
+    Configures the reconnection backoff of every shared Rex connection, including ones opened later.
+
+    Defaults are read from the SPCS_REX_MAX_RETRIES, SPCS_REX_RETRY_DELAY and SPCS_REX_RETRY_INTERVAL environment variables.
+
+    Args:
+        max_retries (int, optional): Reconnection attempts made when the link drops, 1 never sleeps between attempts.
+        retry_delay (float, optional): Initial delay in seconds between attempts, doubled after each attempt.
+        retry_interval (float, optional): Time in seconds before trying again after all attempts failed.
+    """
+    global DEFAULT_MAX_RETRIES, DEFAULT_RETRY_DELAY, DEFAULT_RETRY_INTERVAL
+    with _connections_lock:
+        if max_retries is not None:
+            DEFAULT_MAX_RETRIES = max(1, int(max_retries))
+        if retry_delay is not None:
+            DEFAULT_RETRY_DELAY = float(retry_delay)
+        if retry_interval is not None:
+            DEFAULT_RETRY_INTERVAL = float(retry_interval)
+        for connection in _connections.values():
+            connection.configure(max_retries, retry_delay, retry_interval)
+
+
+def close_connections() -> None:
+    """Closes every shared Rex connection."""
+    with _connections_lock:
+        for connection in _connections.values():
+            connection.close()
+        _connections.clear()
@@ -0,0 +1,68 @@
+import numpy as np
+from rex_utils import Measurement
+
+
+class ArrayMeasurement:
+    """
+    Measurement backed by a numpy array, for traces and waveforms.
+
+    When the Rex connection accepts binary payloads the array is sent as its raw little-endian
+    buffer together with its dtype and shape, straight from the ndarray without copying. Otherwise
+    it falls back to the list encoding of a regular Measurement that older Rex servers expect.
+
+    Attributes:
+        data (np.ndarray): The measured values.
+        unit (str): Unit of the measured values.
+        timestamps (list[str], optional): Timestamps associated with the data.
+    """
+
+    def __init__(self, data, unit: str, timestamps: list[str] = None):
+        self.data = np.asarray(data)
+        if not (
+            np.issubdtype(self.data.dtype, np.number)
+            or np.issubdtype(self.data.dtype, np.bool_)
+        ):
+            raise ValueError(f"data must be numeric, got dtype {self.data.dtype}")
+        self.unit = unit
+        self.timestamps = timestamps
+
+    def __repr__(self) -> str:
+        return f"ArrayMeasurement(shape={self.data.shape}, dtype={self.data.dtype}, unit={self.unit!r})"
+
+    def to_measurement(self) -> Measurement:
+        """
+        Converts to a list backed Measurement. The array is numeric by construction so per element validation is skipped.
+
+        Returns:
+            Measurement: Equivalent rex_utils Measurement.
+        """
+        return Measurement.model_construct(
+            data=self.data.tolist(), unit=self.unit, timestamps=self.timestamps
+        )
+
+    def to_payload(self) -> dict:
+        """Converts to the list based payload format."""
+        return self.to_measurement().to_payload()
+
+    def encode(self) -> tuple[dict, memoryview]:
+        """
+        Builds the binary descriptor and the raw buffer that follows it on the wire.
+
+        The buffer is a view of the array whenever it is already little-endian and C-contiguous.
+
+        Returns:
+            tuple[dict, memoryview]: Descriptor with dtype, shape and size, and the raw bytes.
+        """
+        little_endian = self.data.dtype.newbyteorder("<")
+        array = np.ascontiguousarray(self.data, dtype=little_endian)
+        buffer = memoryview(array).cast("B")
+        descriptor = {
+            "unit": self.unit,
+            "encoding": "binary",
+            "dtype": little_endian.str,
+            "shape": list(array.shape),
+            "nbytes": buffer.nbytes,
+        }
+        if self.timestamps:
+            descriptor["timestamps"] = self.timestamps
+        return descriptor, buffer
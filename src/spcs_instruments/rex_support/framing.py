@@ -0,0 +1,96 @@
+import json
+import socket
+
+from .encoding import ArrayMeasurement
+
+
+def encode_payload(payload: dict) -> bytes | tuple:
+    """
+    Serialise a payload into the newline delimited frame Rex reads.
+
+    Payloads holding ArrayMeasurements become binary frames: a tuple of the JSON header line,
+    in which each array is replaced by its descriptor, followed by the raw array buffers in
+    the order the measurements appear.
+
+    Args:
+        payload (dict): Device payload.
+
+    Returns:
+        bytes | tuple: The encoded frame.
+    """
+    measurements = payload.get("measurements", {})
+    if not any(isinstance(m, ArrayMeasurement) for m in measurements.values()):
+        return (json.dumps(payload) + "\n").encode()
+
+    header = dict(payload, measurements={})
+    buffers = []
+    for name, measurement in measurements.items():
+        if isinstance(measurement, ArrayMeasurement):
+            descriptor, buffer = measurement.encode()
+            header["measurements"][name] = descriptor
+            buffers.append(buffer)
+        else:
+            header["measurements"][name] = measurement
+    return ((json.dumps(header) + "\n").encode(), *buffers)
+
+
+def frame_bytes(frame: bytes | tuple) -> bytes:
+    """Returns the bytes a frame puts on the wire."""
+    return frame if isinstance(frame, bytes) else b"".join(frame)
+
+
+def _chunks(frames: list) -> list:
+    # join the small JSON parts, but hand array buffers to the socket without copying them
+    chunks, pending = [], []
+    for frame in frames:
+        if isinstance(frame, bytes):
+            pending.append(frame)
+            continue
+        pending.append(frame[0])
+        chunks.append(b"".join(pending))
+        chunks.extend(frame[1:])
+        pending = []
+    if pending:
+        chunks.append(b"".join(pending))
+    return chunks
+
+
+def write_frames(sock: socket.socket, frames: list) -> str:
+    """
+    Writes a batch of frames and collects the server acknowledgements.
+
+    Consecutive JSON frames are joined into a single sendall, array buffers of binary frames
+    are written straight from their memory.
+
+    Rex acknowledges every line it receives, so after the first response any further
+    acknowledgements that have already arrived are drained without blocking. Late ones are
+    picked up by the next write.
+
+    Args:
+        sock (socket.socket): Connected Rex socket.
+        frames (list): Encoded payloads from encode_payload.
+
+    Returns:
+        str: The concatenated server responses.
+
+    Raises:
+        ConnectionResetError: If Rex closed the connection.
+    """
+    for chunk in _chunks(frames):
+        sock.sendall(chunk)
+    response = sock.recv(1024)
+    if not response:
+        raise ConnectionResetError("Rex closed the connection")
+    timeout = sock.gettimeout()
+    sock.setblocking(False)
+    try:
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            response += chunk
+    except (BlockingIOError, InterruptedError):
+        pass
+    finally:
+        sock.settimeout(timeout)
+    return response.decode(errors="replace")
@@ -0,0 +1,288 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+logger = logging.getLogger("rex.recorder")
+
+DEFAULT_RECORD_DIR = os.environ.get("SPCS_RECORD_DIR")
+TRACE_DTYPE = pl.List(pl.Float64)
+
+
+class _DeviceBuffer:
+    """Bounded column buffer for a single device."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        existing = sorted(self.directory.glob("part-*.parquet"))
+        self.next_part = int(existing[-1].stem.split("-")[1]) + 1 if existing else 0
+        self.rows = 0
+        self.columns = {"timestamp (s)": []}
+        self.units = {"timestamp (s)": "s"}
+        self.dtypes = {}
+        self.last_flush = time.monotonic()
+
+    def append(self, timestamp: float, measurements: dict) -> None:
+        for name, measurement in measurements.items():
+            if name not in self.columns:
+                self.columns[name] = [None] * self.rows
+            self.units[name] = measurement.unit
+            self.columns[name].append(_as_cell(measurement.data))
+        self.columns["timestamp (s)"].append(timestamp)
+        self.rows += 1
+        for values in self.columns.values():
+            if len(values) < self.rows:
+                values.append(None)
+
+    def flush(self) -> Path | None:
+        if not self.rows:
+            return None
+        series = [
+            _to_series(name, values, self.dtypes.get(name))
+            for name, values in self.columns.items()
+        ]
+        frame = pl.DataFrame(series)
+        path = self.directory / f"part-{self.next_part:06d}.parquet"
+        tmp_path = path.with_suffix(".parquet.tmp")
+        frame.write_parquet(
+            tmp_path,
+            metadata={f"unit:{name}": unit for name, unit in self.units.items()},
+        )
+        # the chunk only becomes visible once its footer has been written in full
+        os.replace(tmp_path, path)
+        self.dtypes.update(
+            {s.name: s.dtype for s in series if s.null_count() < len(s)}
+        )
+        self.next_part += 1
+        self.clear()
+        return path
+
+    def quarantine(self) -> Path | None:
+        """Writes the buffered rows to a JSON file next to the chunks and clears them, for rows that cannot be written as a chunk."""
+        if not self.rows:
+            return None
+        path = self.directory / f"part-{self.next_part:06d}.failed.json"
+        try:
+            with open(path, "w") as f:
+                json.dump(
+                    {
+                        name: [
+                            v.tolist() if isinstance(v, np.ndarray) else v
+                            for v in values
+                        ]
+                        for name, values in self.columns.items()
+                    },
+                    f,
+                )
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"Could not quarantine {self.rows} rows to {path}, dropping them: {e}")
+            path = None
+        self.next_part += 1
+        self.clear()
+        return path
+
+    def clear(self) -> None:
+        self.rows = 0
+        self.columns = {name: [] for name in self.columns}
+        self.last_flush = time.monotonic()
+
+
+def _as_cell(data):
+    array = np.asarray(data, dtype=np.float64)
+    if array.size == 0:
+        return None
+    array = np.squeeze(array)
+    if array.ndim == 0:
+        return float(array)
+    return array.copy()
+
+
+def _to_series(name: str, values: list, previous_dtype=None) -> pl.Series:
+    present = [v for v in values if v is not None]
+    if not present:
+        # keep the schema of earlier chunks so they can be scanned together
+        return pl.Series(name, values, dtype=previous_dtype or pl.Float64)
+    if previous_dtype != TRACE_DTYPE and not any(
+        isinstance(v, np.ndarray) for v in present
+    ):
+        return pl.Series(name, values, dtype=pl.Float64)
+    # traces are always variable length lists, whatever their length in this chunk, and scalars
+    # recorded under the same name (e.g. a single reading next to a sweep) become one element lists
+    return pl.Series(
+        name,
+        [None if v is None else np.atleast_1d(v).ravel().tolist() for v in values],
+        dtype=TRACE_DTYPE,
+    )
+
+
+class MeasurementRecorder:
+    """
+    Records every driver's measurements into append-only, column-oriented Parquet chunks.
+
+    Each device gets its own directory of `part-NNNNNN.parquet` files with one row per `measure()`.
+    Scalar measurements become Float64 columns and traces become List(Float64) columns. Rows are held in a bounded buffer per device and written out as a new chunk once
+    `flush_rows` rows are buffered or `flush_interval` seconds have passed. Chunks are written to
+    a temporary file and renamed into place, so every visible chunk has a complete footer and a
+    crash loses at most the rows still buffered in memory. Rows that cannot be written as a chunk
+    are set aside as `part-NNNNNN.failed.json` rather than kept buffered.
+
+    Attributes:
+        path (Path): Root directory of the recording.
+        flush_rows (int): Maximum number of rows buffered per device before a chunk is written.
+        flush_interval (float): Maximum time in seconds between chunk writes for a device.
+    """
+
+    def __init__(
+        self, path: str, flush_rows: int = 1000, flush_interval: float = 30.0
+    ):
+        self.path = Path(path)
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_interval = flush_interval
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def record(self, device_name: str, measurements: dict) -> None:
+        """
+        Appends a row for the given device.
+
+        Args:
+            device_name (str): Name of the device, used as its directory name.
+            measurements (dict): The driver's measurements dict.
+        """
+        with self._lock:
+            buffer = self._devices.get(device_name)
+            if buffer is None:
+                buffer = self._devices[device_name] = _DeviceBuffer(
+                    self.path / device_name
+                )
+            buffer.append(time.time(), measurements)
+            if (
+                buffer.rows >= self.flush_rows
+                or time.monotonic() - buffer.last_flush >= self.flush_interval
+            ):
+                self._flush(device_name, buffer)
+
+    def flush(self) -> None:
+        """Writes the buffered rows of every device out as new chunks."""
+        with self._lock:
+            for device_name, buffer in self._devices.items():
+                self._flush(device_name, buffer)
+
+    def scan(self, device_name: str) -> pl.LazyFrame:
+        """
+        Lazily scans everything recorded for a device.
+
+        Args:
+            device_name (str): Name of the device.
+
+        Returns:
+            pl.LazyFrame: Lazy frame over all flushed chunks.
+        """
+        return scan_recording(self.path, device_name)
+
+    def _flush(self, device_name: str, buffer: _DeviceBuffer) -> None:
+        try:
+            path = buffer.flush()
+        except Exception as e:
+            logger.error(f"Could not write recording chunk for {device_name}: {e}")
+            # retrying would fail on the same rows, so they are set aside and recording carries on
+            path = buffer.quarantine()
+            if path is not None:
+                logger.error(f"Rows of {device_name} quarantined to {path}")
+            return
+        if path is not None:
+            logger.debug(f"Recorded chunk {path}")
+
+
+def scan_recording(path: str, device_name: str) -> pl.LazyFrame:
+    """
+    Lazily scans a device recording written by MeasurementRecorder.
+
+    Chunks may differ in their columns, as each only holds the measurements seen while it was
+    buffered, and in whether a column holds scalars or traces. The schema is reconciled from the
+    chunk footers: missing columns read as null and scalars in a column that holds traces elsewhere
+    read as one element lists.
+
+    Args:
+        path (str): Root directory of the recording.
+        device_name (str): Name of the device.
+
+    Returns:
+        pl.LazyFrame: Lazy frame over all flushed chunks.
+    """
+    chunks = sorted((Path(path) / device_name).glob("part-*.parquet"))
+    if not chunks:
+        raise FileNotFoundError(f"No recording of {device_name} under {path}")
+    schemas = [pl.read_parquet_schema(chunk) for chunk in chunks]
+    schema = {}
+    for chunk_schema in schemas:
+        for name, dtype in chunk_schema.items():
+            if isinstance(dtype, (pl.List, pl.Array)):
+                # older recordings stored fixed length traces as arrays
+                dtype = TRACE_DTYPE
+            if schema.get(name) != TRACE_DTYPE:
+                schema[name] = dtype
+    frames = []
+    for chunk, chunk_schema in zip(chunks, schemas):
+        columns = []
+        for name, dtype in schema.items():
+            if name not in chunk_schema:
+                columns.append(pl.lit(None, dtype=dtype).alias(name))
+            elif dtype == TRACE_DTYPE and not isinstance(
+                chunk_schema[name], (pl.List, pl.Array)
+            ):
+                column = pl.col(name)
+                columns.append(
+                    pl.when(column.is_null())
+                    .then(pl.lit(None, dtype=dtype))
+                    .otherwise(pl.concat_list(column.cast(pl.Float64)))
+                    .alias(name)
+                )
+            else:
+                columns.append(pl.col(name).cast(dtype))
+        frames.append(pl.scan_parquet(chunk).select(columns))
+    return pl.concat(frames, how="vertical")
+
+
+_recorder = MeasurementRecorder(DEFAULT_RECORD_DIR) if DEFAULT_RECORD_DIR else None
+
+
+def get_recorder() -> MeasurementRecorder | None:
+    """Returns the process wide recorder, or None if recording is off."""
+    return _recorder
+
+
+def start_recording(
+    path: str, flush_rows: int = 1000, flush_interval: float = 30.0
+) -> MeasurementRecorder:
+    """
+    Starts recording every driver's measurements to Parquet chunks under path.
+
+    Recording can also be enabled by setting the SPCS_RECORD_DIR environment variable.
+
+    Args:
+        path (str): Root directory of the recording.
+        flush_rows (int, optional): Rows buffered per device before a chunk is written. Defaults to 1000.
+        flush_interval (float, optional): Maximum time in seconds between chunk writes. Defaults to 30.
+
+    Returns:
+        MeasurementRecorder: The active recorder.
+    """
+    global _recorder
+    stop_recording()
+    _recorder = MeasurementRecorder(path, flush_rows, flush_interval)
+    return _recorder
+
+
+def stop_recording() -> None:
+    """Flushes and detaches the active recorder."""
+    global _recorder
+    if _recorder is not None:
+        _recorder.flush()
+    _recorder = None
@@ -0,0 +1,300 @@
+import logging
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+from collections import deque
+
+from .batching import get_aggregator
+from .connection import send_frames
+from .framing import encode_payload, frame_bytes
+
+logger = logging.getLogger("rex.sender")
+
+BACKPRESSURE_POLICIES = ("block", "drop_oldest", "spill")
+
+DEFAULT_ASYNC = os.environ.get("SPCS_REX_ASYNC", "0").lower() in ("1", "true", "yes")
+DEFAULT_MAX_QUEUE = int(os.environ.get("SPCS_REX_QUEUE_SIZE", "1024"))
+DEFAULT_POLICY = os.environ.get("SPCS_REX_BACKPRESSURE", "block")
+
+
+class _Spill:
+    """
+    Append only overflow file for a single socket, replayed in order once the queue has drained.
+
+    Frames are stored length prefixed, as binary frames may contain newlines.
+    """
+
+    def __init__(self, spill_dir: str):
+        fd, self.path = tempfile.mkstemp(
+            prefix="rex_spill_", suffix=".bin", dir=spill_dir
+        )
+        self.file = os.fdopen(fd, "w+b")
+        self.read_offset = 0
+        self.pending = 0
+
+    def append(self, frame: bytes) -> None:
+        self.file.seek(0, os.SEEK_END)
+        self.file.write(struct.pack("<Q", len(frame)))
+        self.file.write(frame)
+        self.pending += 1
+
+    def read(self, max_frames: int) -> list[bytes]:
+        self.file.flush()
+        self.file.seek(self.read_offset)
+        frames = []
+        while len(frames) < max_frames and self.pending > len(frames):
+            (size,) = struct.unpack("<Q", self.file.read(8))
+            frames.append(self.file.read(size))
+        self.read_offset = self.file.tell()
+        self.pending -= len(frames)
+        return frames
+
+    def close(self) -> None:
+        self.file.close()
+        os.remove(self.path)
+
+
+class AsyncSender:
+    """
+    Bounded queue and dedicated thread that writes payloads to Rex off the acquisition thread.
+
+    `submit` only enqueues, so `measure()` returns as soon as the acquisition is done. When the
+    queue is full the backpressure policy decides what happens:
+
+    - "block": wait for space in the queue.
+    - "drop_oldest": discard the oldest queued payload to make room.
+    - "spill": write the payload to a file on disk, replayed in order once the queue has drained.
+
+    Whatever the sender thread drains from the queue and spill files in one go is written per socket as a
+    single batch, or handed to the payload aggregator when batching is enabled.
+
+    Attributes:
+        enabled (bool): Whether drivers route payloads through the sender.
+        max_queue (int): Maximum number of payloads held in memory.
+        policy (str): Backpressure policy, one of "block", "drop_oldest" or "spill".
+        spill_dir (str): Directory used for spill files.
+        dropped (int): Number of payloads discarded by the "drop_oldest" policy.
+        spilled (int): Number of payloads written to disk by the "spill" policy.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = DEFAULT_ASYNC,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        policy: str = DEFAULT_POLICY,
+        spill_dir: str = None,
+        writer=send_frames,
+    ):
+        self.enabled = enabled
+        self.max_queue = max(1, int(max_queue))
+        self.policy = self._check_policy(policy)
+        self.spill_dir = spill_dir or tempfile.gettempdir()
+        self.writer = writer
+        self.dropped = 0
+        self.spilled = 0
+        self._queue = deque()
+        self._spills = {}
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def configure(
+        self,
+        enabled: bool = None,
+        max_queue: int = None,
+        policy: str = None,
+        spill_dir: str = None,
+    ) -> None:
+        """
+        Updates the sender settings. Anything already queued is sent before the change takes effect.
+
+        Args:
+            enabled (bool, optional): Route payloads through the background sender.
+            max_queue (int, optional): Maximum number of payloads held in memory.
+            policy (str, optional): Backpressure policy, "block", "drop_oldest" or "spill".
+            spill_dir (str, optional): Directory used for spill files.
+        """
+        self.flush()
+        with self._cond:
+            if enabled is not None:
+                self.enabled = enabled
+            if max_queue is not None:
+                self.max_queue = max(1, int(max_queue))
+            if policy is not None:
+                self.policy = self._check_policy(policy)
+            if spill_dir is not None:
+                self.spill_dir = spill_dir
+
+    def submit(self, sock: socket.socket, payload: dict) -> None:
+        """
+        Queues a payload for the sender thread, applying the backpressure policy if the queue is full.
+
+        The payload is encoded before it is queued, without holding the queue lock, so the driver may
+        reuse its arrays for the next acquisition straight away.
+
+        Args:
+            sock (socket.socket): Connected Rex socket the payload is destined for.
+            payload (dict): Validated device payload.
+        """
+        frame = frame_bytes(encode_payload(payload))
+        with self._cond:
+            self._start()
+            spill = self._spills.get(sock)
+            if spill is not None:
+                # keep ordering, once a socket has spilled everything after it spills too
+                spill.append(frame)
+                self.spilled += 1
+                self._cond.notify_all()
+                return
+            while len(self._queue) >= self.max_queue:
+                match self.policy:
+                    case "block":
+                        self._cond.wait()
+                    case "drop_oldest":
+                        self._queue.popleft()
+                        self.dropped += 1
+                        if self.dropped == 1:
+                            logger.warning(
+                                "Rex sender queue is full, dropping the oldest payloads"
+                            )
+                    case "spill":
+                        spill = self._spills[sock] = _Spill(self.spill_dir)
+                        spill.append(frame)
+                        self.spilled += 1
+                        self._cond.notify_all()
+                        return
+            self._queue.append((sock, frame))
+            self._cond.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until everything queued or spilled has been handed to the socket.
+
+        Args:
+            timeout (float, optional): Maximum time to wait in seconds, waits indefinitely if None.
+
+        Returns:
+            bool: True if the sender drained, False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._spills or self._in_flight:
+                if self._thread is None or not self._thread.is_alive():
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        aggregator = get_aggregator()
+        if aggregator.enabled:
+            aggregator.flush()
+        return True
+
+    def close(self) -> None:
+        """Flushes the queue and stops the sender thread."""
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _check_policy(self, policy: str) -> str:
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(
+                f"Unknown backpressure policy '{policy}', options: {BACKPRESSURE_POLICIES}"
+            )
+        return policy
+
+    def _start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._closed = False
+            self._thread = threading.Thread(
+                target=self._run, name="rex-sender", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._spills and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._queue and not self._spills:
+                    return
+                batches = self._take_queued()
+                for sock, frames in self._take_spilled().items():
+                    batches.setdefault(sock, []).extend(frames)
+                self._in_flight += 1
+                self._cond.notify_all()
+            try:
+                for sock, frames in batches.items():
+                    self._deliver(sock, frames)
+            except OSError as e:
+                logger.error(f"Dropped a batch of Rex payloads: {e}")
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+    def _take_queued(self) -> dict:
+        batches = {}
+        while self._queue:
+            sock, frame = self._queue.popleft()
+            batches.setdefault(sock, []).append(frame)
+        return batches
+
+    def _take_spilled(self) -> dict:
+        batches = {}
+        for sock, spill in list(self._spills.items()):
+            batches[sock] = spill.read(self.max_queue)
+            if not spill.pending:
+                spill.close()
+                del self._spills[sock]
+        return batches
+
+    def _deliver(self, sock: socket.socket, frames: list) -> None:
+        aggregator = get_aggregator()
+        if aggregator.enabled:
+            aggregator.submit_frames(sock, frames)
+        elif frames:
+            self.writer(sock, frames)
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def get_sender() -> AsyncSender:
+    """Returns the process wide background sender, creating it on first use."""
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            _sender = AsyncSender()
+        return _sender
+
+
+def configure_async(
+    enabled: bool = True,
+    max_queue: int = None,
+    policy: str = None,
+    spill_dir: str = None,
+) -> None:
+    """
+    Configures the opt-in asynchronous send mode used by every driver.
+
+    Defaults are read from the SPCS_REX_ASYNC, SPCS_REX_QUEUE_SIZE and SPCS_REX_BACKPRESSURE environment variables.
+
+    Args:
+        enabled (bool, optional): Send payloads from a background thread. Defaults to True.
+        max_queue (int, optional): Maximum number of payloads held in memory.
+        policy (str, optional): Backpressure policy when the queue is full, "block", "drop_oldest" or "spill".
+        spill_dir (str, optional): Directory used for spill files, defaults to the system temp directory.
+    """
+    get_sender().configure(
+        enabled=enabled, max_queue=max_queue, policy=policy, spill_dir=spill_dir
+    )
@@ -0,0 +1,117 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+
+class FakeRex:
+    """
+    Minimal Rex server on localhost that acknowledges every frame with one line.
+
+    Binary frames are read back using the descriptors in their header line, so the decoded
+    payloads and their raw array buffers can be inspected.
+
+    Attributes:
+        port (int): Port the server listens on.
+        payloads (list[dict]): Header of every frame received, in order.
+        buffers (list[list[bytes]]): Raw array buffers of every frame received, in order.
+        connections (int): Number of connections accepted.
+        drop_after (int | None): If set, the next connection is closed without acknowledging any
+            further frames once this many have been acknowledged on it, like a link that drops
+            mid-batch.
+    """
+
+    ACK = b"Running\n"
+
+    def __init__(self, port: int = 0):
+        self.payloads = []
+        self.buffers = []
+        self.connections = 0
+        self.drop_after = None
+        self._clients = []
+        self._lock = threading.Lock()
+        self._listener = None
+        self.port = port
+        self.start()
+
+    def start(self) -> None:
+        """Starts listening, on the same port as before if the server was stopped."""
+        self._listener = socket.socket()
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(("127.0.0.1", self.port))
+        self._listener.listen()
+        self.port = self._listener.getsockname()[1]
+        threading.Thread(
+            target=self._accept, args=(self._listener,), daemon=True
+        ).start()
+
+    def stop(self) -> None:
+        """Closes the listening socket and every client connection."""
+        try:
+            # wakes the accept thread, close alone leaves the port listening
+            self._listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._listener.close()
+        with self._lock:
+            for client in self._clients:
+                try:
+                    client.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                client.close()
+            self._clients.clear()
+
+    def wait_for(self, count: int, timeout: float = 5.0) -> list[dict]:
+        """Waits until at least count frames have been received and returns the headers."""
+        deadline = time.monotonic() + timeout
+        while len(self.payloads) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.payloads
+
+    def values(self, name: str = "counts") -> list:
+        """Returns the first value of a measurement from every payload received."""
+        return [p["measurements"][name]["data"][0] for p in self.payloads]
+
+    def _accept(self, listener: socket.socket) -> None:
+        while True:
+            try:
+                client, _ = listener.accept()
+            except OSError:
+                return
+            with self._lock:
+                self._clients.append(client)
+                self.connections += 1
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client: socket.socket) -> None:
+        stream = client.makefile("rb")
+        drop_after, self.drop_after = self.drop_after, None
+        acked = 0
+        try:
+            while line := stream.readline():
+                header = json.loads(line)
+                buffers = [
+                    stream.read(m["nbytes"])
+                    for m in header.get("measurements", {}).values()
+                    if isinstance(m, dict) and m.get("encoding") == "binary"
+                ]
+                with self._lock:
+                    self.payloads.append(header)
+                    self.buffers.append(buffers)
+                if acked == drop_after:
+                    client.close()
+                    return
+                client.sendall(self.ACK)
+                acked += 1
+        except (OSError, ValueError):
+            pass
+
+
+@pytest.fixture
+def rex():
+    server = FakeRex()
+    yield server
+    server.stop()
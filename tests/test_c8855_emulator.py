@@ -0,0 +1,150 @@
+import logging
+import time
+
+import numpy as np
+import pytest
+import toml
+
+from spcs_instruments import C8855_counting_unit
+from spcs_instruments.instruments.c8855_support import BinStatistics
+
+
+def counter(tmp_path, **settings) -> C8855_counting_unit:
+    config = {
+        "transfer_type": "block_transfer",
+        "number_of_gates": 16,
+        "gate_time": "50us",
+        "trigger_type": "software",
+        "cycles": 4,
+        "measure_mode": "all",
+        "backend": "emulator",
+        "emulator_rate": 2e5,
+        "emulator_realtime": False,
+        "emulator_seed": 1,
+    }
+    config.update(settings)
+    path = tmp_path / "c8855.toml"
+    path.write_text(toml.dumps({"device": {"C8855_photon_counter": config}}))
+    return C8855_counting_unit(str(path), connect_to_rex=False)
+
+
+def assert_handles_balanced(calls: dict) -> None:
+    assert calls["C8855Open"] > 0
+    assert calls["C8855Open"] == calls["C8855Close"]
+    assert calls["C8855CountStart"] == calls["C8855CountStop"]
+
+
+def test_session_and_per_cycle_measurements_count_the_same(tmp_path):
+    results = {}
+    for session in (True, False):
+        with counter(tmp_path, session=session) as c:
+            trace, counts = c.measure()
+            results[session] = (trace.copy(), counts)
+        assert_handles_balanced(c.dll.calls)
+        assert c.device_handle is None
+
+    np.testing.assert_array_equal(results[True][0], results[False][0])
+    assert results[True][1] == results[False][1] == results[True][0].sum()
+
+
+def test_session_opens_the_device_once(tmp_path):
+    with counter(tmp_path, session=True) as c:
+        c.measure()
+        c.measure()
+        assert c.dll.calls["C8855Open"] == 1
+        assert c.dll.calls["C8855CountStart"] == 8
+    assert_handles_balanced(c.dll.calls)
+
+
+def test_per_cycle_measurements_close_every_handle(tmp_path):
+    with counter(tmp_path, session=False) as c:
+        c.measure()
+        assert c.dll.calls["C8855Open"] == 4
+        assert c.dll.calls["C8855Close"] == 4
+    assert_handles_balanced(c.dll.calls)
+
+
+def test_stream_drops_blocks_counted_before_measure(tmp_path):
+    with counter(tmp_path, emulator_realtime=True, stream_buffers=2) as c:
+        c.start_stream()
+        # both buffers fill while nothing consumes them, like during a stage move
+        time.sleep(0.05)
+        trace, counts = c.measure()
+
+        assert c.stream_discarded >= 1
+        assert c.cycles_measured == 4
+        assert counts == trace.sum() > 0
+
+        c.stop_stream()
+        assert not c.streaming
+    assert_handles_balanced(c.dll.calls)
+
+
+def test_stream_yields_the_requested_blocks(tmp_path):
+    with counter(tmp_path, emulator_realtime=True) as c:
+        blocks = list(c.stream(3, since=time.perf_counter()))
+        c.stop_stream()
+
+    assert len(blocks) == 3
+    assert all(block.shape == (16,) for block in blocks)
+    assert_handles_balanced(c.dll.calls)
+
+
+def test_stop_stream_gives_up_on_a_stuck_read(tmp_path, caplog):
+    # reads do not complete in time, like an external trigger that never comes
+    c = counter(tmp_path, emulator_latency=3.0)
+    c.start_stream()
+    time.sleep(0.01)
+
+    start = time.monotonic()
+    with caplog.at_level(logging.WARNING):
+        c.stop_stream(timeout=0.1)
+
+    assert time.monotonic() - start < 2.0
+    assert not c.streaming
+    assert "did not stop" in caplog.text
+    c.close()
+
+
+def test_bin_statistics_agree_with_numpy():
+    counts = np.random.default_rng(1).poisson(50, (40, 8)).astype(np.uint64)
+    statistics = BinStatistics(8)
+    for row in counts:
+        statistics.update(row)
+
+    assert statistics.count == 40
+    np.testing.assert_allclose(statistics.mean, counts.mean(axis=0))
+    np.testing.assert_allclose(statistics.variance, counts.var(axis=0, ddof=1))
+    np.testing.assert_allclose(
+        statistics.sem, counts.std(axis=0, ddof=1) / np.sqrt(40)
+    )
+    totals = counts.sum(axis=1)
+    assert statistics.total_sem == pytest.approx(totals.std(ddof=1) / np.sqrt(40))
+    assert statistics.relative_error == pytest.approx(
+        statistics.total_sem / totals.mean()
+    )
+
+
+@pytest.mark.parametrize("stream", [False, True], ids=["cycles", "stream"])
+def test_measurement_stops_early_once_converged(tmp_path, stream):
+    with counter(
+        tmp_path, cycles=1000, session=True, target_relative_error=0.01
+    ) as c:
+        if stream:
+            c.start_stream()
+        c.measure()
+
+        assert c.converged()
+        assert c.min_cycles <= c.cycles_measured < 1000
+        assert c.statistics.relative_error <= 0.01
+        assert c.measurements["cycles_measured"].data == [c.cycles_measured]
+    assert_handles_balanced(c.dll.calls)
+
+
+def test_measurement_takes_every_cycle_without_a_target(tmp_path):
+    with counter(tmp_path, cycles=20, session=True) as c:
+        c.measure()
+
+        assert not c.converged()
+        assert c.cycles_measured == 20
+        assert "cycles_measured" not in c.measurements
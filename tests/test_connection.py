@@ -0,0 +1,121 @@
+import socket
+import time
+
+from spcs_instruments.rex_support import PayloadAggregator, RexConnection
+from spcs_instruments.rex_support.connection import send_frames
+from spcs_instruments.rex_support.framing import encode_payload
+
+
+def payload(value: float) -> dict:
+    return {
+        "device_name": "Test_DAQ",
+        "measurements": {"counts": {"data": [value], "unit": "dimensionless"}},
+    }
+
+
+def frame(value: float) -> bytes:
+    return encode_payload(payload(value))
+
+
+def unused_port() -> int:
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+
+def test_batched_payloads_are_acknowledged_once_per_line(rex):
+    connection = RexConnection("127.0.0.1", rex.port)
+    assert connection.connect()
+    responses = []
+
+    def writer(target, frames):
+        responses.append(send_frames(target, frames))
+
+    aggregator = PayloadAggregator(max_batch=10, max_latency=60.0, writer=writer)
+    for i in range(100):
+        aggregator.submit(connection, payload(i))
+    aggregator.close()
+
+    assert aggregator.writes == 10
+    assert rex.wait_for(100) and rex.values() == list(range(100))
+    # acknowledgements that arrive after a write has returned are picked up later, none go missing
+    connection._await_acks(timeout=2.0)
+    assert connection.pending == 0
+    connection.close()
+
+
+def test_undelivered_payloads_are_replayed_in_order_after_reconnect(rex):
+    connection = RexConnection(
+        "127.0.0.1", rex.port, max_retries=1, retry_delay=0.0, retry_interval=0.0
+    )
+    assert connection.connect()
+    for i in range(3):
+        assert connection.write([frame(i)])
+    rex.wait_for(3)
+
+    rex.stop()
+    for i in range(3, 6):
+        assert connection.write([frame(i)]) == ""
+    assert not connection.connected
+
+    rex.start()
+    assert connection.write([frame(6)])
+    assert rex.wait_for(7) and rex.values() == list(range(7))
+    assert connection.reconnects == 1
+    connection.close()
+
+
+def test_acknowledged_payloads_are_not_replayed_after_the_link_drops(rex):
+    connection = RexConnection(
+        "127.0.0.1", rex.port, max_retries=1, retry_delay=0.0, retry_interval=0.0
+    )
+    # Rex acknowledges the first half of the batch, then the link drops
+    rex.drop_after = 5
+    assert connection.connect()
+    connection.write([frame(i) for i in range(10)])
+    assert rex.wait_for(6)
+    connection.write([frame(10)])
+    connection.write([frame(11)])
+
+    # frame 5 was stored but never acknowledged, so it is the only one delivered twice
+    assert rex.wait_for(13) and rex.values() == list(range(6)) + list(range(5, 12))
+    assert connection.reconnects >= 1
+    connection._await_acks(timeout=2.0)
+    assert connection.pending == 0
+    connection.close()
+
+
+def test_replay_buffer_keeps_the_newest_payloads(rex):
+    connection = RexConnection(
+        "127.0.0.1",
+        rex.port,
+        replay_size=2,
+        max_retries=1,
+        retry_delay=0.0,
+        retry_interval=0.0,
+    )
+    rex.stop()
+    for i in range(5):
+        connection.write([frame(i)])
+    rex.start()
+    connection.write([frame(5)])
+    assert rex.wait_for(2) and rex.values() == [4, 5]
+    connection.close()
+
+
+def test_single_reconnect_attempt_does_not_sleep():
+    connection = RexConnection(
+        "127.0.0.1",
+        unused_port(),
+        max_retries=1,
+        retry_delay=10.0,
+        retry_interval=60.0,
+    )
+    start = time.monotonic()
+    assert connection.write([frame(0)]) == ""
+    assert connection.write([frame(1)]) == ""
+    assert time.monotonic() - start < 1.0
+    assert len(connection._backlog) == 2
+    connection.close()
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from spcs_instruments.rex_support import ArrayMeasurement, RexConnection
+from spcs_instruments.rex_support.framing import encode_payload
+
+
+def decode(descriptor: dict, buffer: bytes) -> np.ndarray:
+    return np.frombuffer(buffer, dtype=descriptor["dtype"]).reshape(descriptor["shape"])
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        np.linspace(-1.0, 1.0, 1000),
+        np.arange(256, dtype=">i2"),
+        np.arange(24, dtype=np.float32).reshape(4, 6),
+        np.arange(40, dtype=np.uint32)[::3],
+        # newline bytes inside the buffer must not split the frame
+        np.full(16, ord("\n"), dtype=np.uint8),
+    ],
+    ids=["float64", "big-endian", "2d", "strided", "newlines"],
+)
+def test_binary_payload_round_trips_through_rex(rex, data):
+    connection = RexConnection("127.0.0.1", rex.port, binary=True)
+    assert connection.connect()
+    payload = {
+        "device_name": "Test_DAQ",
+        "measurements": {
+            "trace": ArrayMeasurement(data, "V"),
+            "counts": {"data": [3.0], "unit": "dimensionless"},
+            "time": ArrayMeasurement(np.arange(3.0), "s"),
+        },
+    }
+    assert connection.write([encode_payload(payload), encode_payload(payload)])
+    rex.wait_for(2)
+    connection.close()
+
+    assert len(rex.payloads) == 2
+    for header, (trace, time) in zip(rex.payloads, rex.buffers):
+        measurements = header["measurements"]
+        assert measurements["counts"] == {"data": [3.0], "unit": "dimensionless"}
+        assert measurements["trace"]["unit"] == "V"
+        np.testing.assert_array_equal(decode(measurements["trace"], trace), data)
+        np.testing.assert_array_equal(
+            decode(measurements["time"], time), np.arange(3.0)
+        )
+
+
+def test_encode_describes_the_little_endian_buffer():
+    descriptor, buffer = ArrayMeasurement(np.arange(4, dtype=">f8"), "s").encode()
+
+    assert descriptor == {
+        "unit": "s",
+        "encoding": "binary",
+        "dtype": "<f8",
+        "shape": [4],
+        "nbytes": 32,
+    }
+    np.testing.assert_array_equal(decode(descriptor, bytes(buffer)), np.arange(4.0))
+
+
+def test_list_fallback_matches_the_array():
+    data = np.arange(5, dtype=np.int16)
+    measurement = ArrayMeasurement(data, "counts").to_measurement()
+
+    assert measurement.data == data.tolist()
+    assert measurement.unit == "counts"
+
+
+def test_non_numeric_data_is_rejected():
+    with pytest.raises(ValueError):
+        ArrayMeasurement(["a", "b"], "V")
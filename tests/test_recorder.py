@@ -0,0 +1,91 @@
+import numpy as np
+import polars as pl
+import pytest
+from rex_utils import Measurement
+
+from spcs_instruments.rex_support import (
+    ArrayMeasurement,
+    MeasurementRecorder,
+    scan_recording,
+)
+from spcs_instruments.rex_support.recorder import TRACE_DTYPE
+
+
+def test_chunks_with_different_traces_and_columns_read_back_together(tmp_path):
+    recorder = MeasurementRecorder(tmp_path, flush_rows=2, flush_interval=3600.0)
+    for i in range(2):
+        recorder.record(
+            "scope",
+            {
+                "area": Measurement(data=[float(i)], unit="Vs"),
+                "trace": ArrayMeasurement(np.full(5, i, dtype=np.int16), "V"),
+            },
+        )
+    for i in range(2, 4):
+        recorder.record(
+            "scope",
+            {
+                "area": Measurement(data=[float(i)], unit="Vs"),
+                "trace": ArrayMeasurement(np.full(6, i, dtype=np.int16), "V"),
+                "peak": Measurement(data=[10.0 * i], unit="V"),
+            },
+        )
+    # a single point recorded under the name of a trace
+    recorder.record(
+        "scope",
+        {
+            "area": Measurement(data=[4.0], unit="Vs"),
+            "trace": Measurement(data=[4.0], unit="V"),
+        },
+    )
+    recorder.flush()
+
+    assert len(list((tmp_path / "scope").glob("part-*.parquet"))) == 3
+    frame = scan_recording(tmp_path, "scope").collect()
+
+    assert frame.schema["trace"] == TRACE_DTYPE
+    assert frame["area"].to_list() == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert frame["peak"].to_list() == [None, None, 20.0, 30.0, None]
+    assert frame["trace"].to_list() == [
+        [0.0] * 5,
+        [1.0] * 5,
+        [2.0] * 6,
+        [3.0] * 6,
+        [4.0],
+    ]
+
+
+def test_scalar_chunk_before_trace_chunk_reads_back(tmp_path):
+    recorder = MeasurementRecorder(tmp_path, flush_rows=1, flush_interval=3600.0)
+    recorder.record("daq", {"counts": Measurement(data=[1.0], unit="dimensionless")})
+    recorder.record(
+        "daq", {"counts": ArrayMeasurement(np.arange(3.0), "dimensionless")}
+    )
+
+    frame = recorder.scan("daq").select("counts").collect()
+
+    assert frame["counts"].to_list() == [[1.0], [0.0, 1.0, 2.0]]
+
+
+def test_rows_that_cannot_be_written_are_quarantined(tmp_path, monkeypatch):
+    recorder = MeasurementRecorder(tmp_path, flush_rows=10, flush_interval=3600.0)
+    recorder.record("daq", {"counts": Measurement(data=[1.0], unit="dimensionless")})
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(pl.DataFrame, "write_parquet", fail)
+        recorder.flush()
+    assert (tmp_path / "daq" / "part-000000.failed.json").exists()
+
+    recorder.record("daq", {"counts": Measurement(data=[2.0], unit="dimensionless")})
+    recorder.flush()
+    frame = scan_recording(tmp_path, "daq").collect()
+
+    assert frame["counts"].to_list() == [2.0]
+
+
+def test_missing_recording_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        scan_recording(tmp_path, "nothing")
@@ -0,0 +1,99 @@
+import threading
+
+import numpy as np
+import pytest
+
+from spcs_instruments.rex_support import ArrayMeasurement, AsyncSender, RexConnection
+from spcs_instruments.rex_support.connection import send_frames
+
+
+def payload(value: float) -> dict:
+    return {
+        "device_name": "Test_DAQ",
+        "measurements": {"counts": {"data": [value], "unit": "dimensionless"}},
+    }
+
+
+class StalledWriter:
+    """Writes to Rex once released, so the sender queue fills up behind the first batch."""
+
+    def __init__(self):
+        self.writing = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, target, frames):
+        self.writing.set()
+        assert self.release.wait(5.0)
+        return send_frames(target, frames)
+
+
+@pytest.fixture
+def connection(rex):
+    connection = RexConnection("127.0.0.1", rex.port)
+    assert connection.connect()
+    yield connection
+    connection.close()
+
+
+def fill(sender, writer, connection, count):
+    sender.submit(connection, payload(0))
+    assert writer.writing.wait(5.0)
+    for i in range(1, count):
+        sender.submit(connection, payload(i))
+    writer.release.set()
+    assert sender.flush(5.0)
+    sender.close()
+
+
+def test_drop_oldest_discards_the_oldest_queued_payloads(rex, connection):
+    writer = StalledWriter()
+    sender = AsyncSender(
+        enabled=True, max_queue=4, policy="drop_oldest", writer=writer
+    )
+    fill(sender, writer, connection, 11)
+
+    assert sender.dropped == 6
+    assert rex.wait_for(5) and rex.values() == [0, 7, 8, 9, 10]
+
+
+def test_spill_replays_every_payload_in_order(rex, connection, tmp_path):
+    writer = StalledWriter()
+    sender = AsyncSender(
+        enabled=True, max_queue=4, policy="spill", spill_dir=tmp_path, writer=writer
+    )
+    fill(sender, writer, connection, 11)
+
+    assert sender.spilled == 6
+    assert rex.wait_for(11) and rex.values() == list(range(11))
+    assert not list(tmp_path.iterdir())
+
+
+def test_queued_payloads_do_not_see_later_changes_to_the_driver_arrays(
+    rex, connection
+):
+    connection.binary = True
+    writer = StalledWriter()
+    sender = AsyncSender(enabled=True, max_queue=4, writer=writer)
+    trace = np.zeros(8)
+    sender.submit(connection, payload(0))
+    assert writer.writing.wait(5.0)
+    sender.submit(
+        connection,
+        {
+            "device_name": "Test_DAQ",
+            "measurements": {"trace": ArrayMeasurement(trace, "V")},
+        },
+    )
+    # the driver reuses its buffer for the next acquisition while the payload is queued
+    trace[:] = 1.0
+    writer.release.set()
+    assert sender.flush(5.0)
+    sender.close()
+
+    assert rex.wait_for(2)
+    np.testing.assert_array_equal(np.frombuffer(rex.buffers[1][0]), np.zeros(8))
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        AsyncSender(policy="drop_newest")